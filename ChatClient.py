@@ -0,0 +1,121 @@
+import os
+import json
+import threading
+
+import requests
+
+# Unset: the service runs inside this process (see service_url).
+CHAT_SERVICE_URL = os.getenv("CHAT_SERVICE_URL", "").rstrip("/")
+CHAT_SERVICE_TIMEOUT = float(os.getenv("CHAT_SERVICE_TIMEOUT", "120"))
+
+_session = requests.Session()
+_embedded_url = None
+_embedded_lock = threading.Lock()
+
+
+class ServiceError(Exception):
+    pass
+
+
+def service_url():
+    """Base URL of the chat service.
+
+    Without CHAT_SERVICE_URL the service is started once, in a background
+    thread of this process, so a plain `streamlit run app.py` works.
+    """
+    global _embedded_url
+    if CHAT_SERVICE_URL:
+        return CHAT_SERVICE_URL
+    with _embedded_lock:
+        if _embedded_url is None:
+            try:
+                from ChatService import start_background
+                _embedded_url = start_background()
+            except Exception as e:
+                raise ServiceError(f"Could not start the embedded chat service: {e}") from e
+    return _embedded_url
+
+
+def _post(path, payload, stream=False, timeout=CHAT_SERVICE_TIMEOUT):
+    url = service_url()
+    try:
+        response = _session.post(f"{url}{path}", json=payload, stream=stream, timeout=timeout)
+    except requests.exceptions.RequestException as e:
+        raise ServiceError(f"Chat service unreachable at {url}: {e}") from e
+    if response.status_code >= 400:
+        message = response.text
+        response.close()
+        raise ServiceError(message or f"HTTP {response.status_code}")
+    return response
+
+
+def get_health():
+    """Service status, or None when the service cannot be reached.
+
+    Raises ServiceError when the embedded service fails to start.
+    """
+    try:
+        response = _session.get(f"{service_url()}/health", timeout=5)
+        response.raise_for_status()
+        return response.json()
+    except requests.exceptions.RequestException:
+        return None
+
+
+def sync_index():
+    return _post("/sync", {}, timeout=None).json()
+
+
+def retrieve(query, n_results=10, session_id=None):
+    data = _post("/retrieve", {"query": query, "n_results": n_results, "session_id": session_id}).json()
+    return data["queries"], data["chunks"]
+
+
+def _iter_events(response):
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if line:
+                yield json.loads(line)
+    finally:
+        response.close()
+
+
+def _iter_tokens(events, context):
+    try:
+        for event in events:
+            if event["type"] == "token":
+                yield event["text"]
+            elif event["type"] == "done":
+                context["trace"] = event.get("trace")
+                return
+    except requests.exceptions.RequestException as e:
+        yield f"\n\n❌ Stream interrupted: {str(e)}"
+
+
+def stream_answer(query, chat_history=None, n_results=10, session_id=None):
+    """Ask the service for a streamed answer.
+
+    Blocks until retrieval is done and returns (context, tokens): `context`
+    holds queries, chunks and used_chunks; `tokens` is a generator of text
+    pieces suitable for st.write_stream. `session_id` groups this user's
+    calls for fair queueing under the Groq rate limit. Once the stream is
+    exhausted, context["trace"] holds the service's spans for the turn.
+    """
+    response = _post(
+        "/answer",
+        {
+            "query": query,
+            "chat_history": chat_history or [],
+            "n_results": n_results,
+            "stream": True,
+            "session_id": session_id,
+        },
+        stream=True
+    )
+    events = _iter_events(response)
+    context = next(events, None)
+    if context is None or context["type"] != "context":
+        response.close()
+        raise ServiceError("Chat service closed the stream before sending context")
+    context["trace"] = None
+    return context, _iter_tokens(events, context)
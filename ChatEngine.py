@@ -1,139 +1,373 @@
 import requests
 import os
+import re
+import json
 import time
-from sentence_transformers import SentenceTransformer
-import chromadb
-from chromadb.utils import embedding_functions
+import hashlib
+import logging
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from LLMClient import GROQ_API_KEY, RateLimitExceeded, chat_completion
+from Caches import TieredCache
+from Tracing import annotate_span, span, start_span, use_span
+from IndexManager import get_catalog
+from Embeddings import get_embedding_function
 
 load_dotenv()
 
-GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_MODEL = "llama-3.3-70b-versatile"
 
 if not GROQ_API_KEY:
     raise ValueError("⚠️ GROQ_API_KEY not set! Please add it to environment variables.")
 
-GROQ_RATE_LIMIT_UNTIL = 0
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+ANSWER_MAX_TOKENS = int(os.getenv("ANSWER_MAX_TOKENS", "1500"))
+MAX_CONTEXT_CHUNKS = int(os.getenv("MAX_CONTEXT_CHUNKS", "12"))
+MIN_CHUNK_TOKENS = int(os.getenv("MIN_CHUNK_TOKENS", "120"))
+# Most of the prompt budget (after the answer reservation) the conversation history may take.
+HISTORY_TOKEN_SHARE = float(os.getenv("HISTORY_TOKEN_SHARE", "0.25"))
+TRANSLATION_MAX_QUEUE_WAIT = float(os.getenv("TRANSLATION_MAX_QUEUE_WAIT", "4"))
+TOKEN_ESTIMATE_PATTERN = re.compile(r"\w+|[^\w\s]")
+
+logger = logging.getLogger(__name__)
+
+CACHE_FOLDER = os.getenv("CACHE_FOLDER", "./cache")
+translation_executor = ThreadPoolExecutor(
+    max_workers=int(os.getenv("TRANSLATION_WORKERS", "8")),
+    thread_name_prefix="translate"
+)
+translation_cache = TieredCache(
+    os.path.join(CACHE_FOLDER, "translations.sqlite"),
+    memory_items=int(os.getenv("TRANSLATION_CACHE_MEMORY_ITEMS", "1024")),
+    disk_items=int(os.getenv("TRANSLATION_CACHE_DISK_ITEMS", "20000"))
+)
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "86400"))
+answer_cache = TieredCache(
+    os.path.join(CACHE_FOLDER, "answers.sqlite"),
+    memory_items=int(os.getenv("ANSWER_CACHE_MEMORY_ITEMS", "256")),
+    disk_items=int(os.getenv("ANSWER_CACHE_DISK_ITEMS", "5000"))
+)
+
+
+SYSTEM_PROMPT = """You are a highly accurate and professional assistant for the Master Biomedical Engineering (MBE) program at Hochschule Anhalt.
+CRITICAL RULES:
 
+- Answer EXCLUSIVELY based on the provided document sources or previous conversation history.
+- If the question is a follow-up (e.g., "summarize that", "explain more", "what about X"), use the conversation history FIRST.
+- If no relevant information exists: Reply exactly "No sufficient information in the available documents."
+- Use the SAME language as the user's question (English, German, or Arabic).
+- Be concise, clear, and professional. Use bullet points or numbering when listing items.
+- Always cite sources briefly (e.g., "According to SPO MBE 2024, page X...").
+- NEVER hallucinate, explain your reasoning, or add external knowledge.
+- For summarization requests of entire documents (e.g., module handbook, SPO): Provide a high-level overview including program duration, total credits, main modules/specializations, semester structure, and key regulations, based on extracted information from sources.
+- Always use bullet points or numbered lists for summaries.
+- Cite multiple pages/sources where possible.
+- When asked about Master's thesis registration or regulations, prioritize information from "94_B14_SPO_MBE..." or "Notes_on_final_theses..." documents.
+- For module handbook summaries, list key modules, their credits, and semester distribution if available.
+- For counting or lists: Be precise and complete.
+-If a catalog contains both an outline (e.g., WPM codes) and a detailed list of modules, always prefer the detailed module list when the user asks for module names.
+"""
 
-def get_embedding_function():
-    return embedding_functions.SentenceTransformerEmbeddingFunction(
-        model_name="intfloat/multilingual-e5-large"
-    )
+USER_PROMPT_TEMPLATE = """CONVERSATION HISTORY (for follow-ups only):
+{history}
 
+DOCUMENT SOURCES:
+{context}
 
-def answer_question_with_groq(query, relevant_chunks, chat_history=None):
-    global GROQ_RATE_LIMIT_UNTIL
+CURRENT QUESTION: {query}
 
-    now = time.time()
-    if now < GROQ_RATE_LIMIT_UNTIL:
-        wait_seconds = int(GROQ_RATE_LIMIT_UNTIL - now)
-        return (
-            f"⏳ Groq rate limit reached. Please wait {wait_seconds} seconds before sending a new request.",
-            []
-        )
+ANSWER directly and precisely:"""
 
+
+def estimate_tokens(text):
+    """Rough local token count: word pieces and punctuation, padded for subword splits."""
+    return int(len(TOKEN_ESTIMATE_PATTERN.findall(text)) * 1.3) + 1
+
+
+def _trim_to_tokens(text, max_tokens):
+    words = text.split()
+    keep = int(len(words) * max_tokens / max(estimate_tokens(text), 1))
+    while keep > 0 and estimate_tokens(" ".join(words[:keep])) > max_tokens:
+        keep = int(keep * 0.9)
+    return " ".join(words[:keep]) + " …" if keep else ""
+
+
+def pack_context(relevant_chunks, token_budget, max_chunks=MAX_CONTEXT_CHUNKS):
+    """Pick chunks in rank order until the token budget is spent.
+
+    A chunk that does not fit is trimmed when at least MIN_CHUNK_TOKENS
+    remain, otherwise skipped so smaller lower-ranked chunks can still fit.
+    Returns (context_parts, used_chunks, tokens_used).
+    """
     context_parts = []
-    used_chunks = []  
-    for i, chunk in enumerate(relevant_chunks[:12], 1):
+    used_chunks = []
+    used = 0
+    for chunk in relevant_chunks:
+        if len(used_chunks) >= max_chunks or token_budget - used < MIN_CHUNK_TOKENS:
+            break
         source = chunk["metadata"].get("source", "Unknown")
         page = chunk["metadata"].get("page", "N/A")
         content = chunk["content"]
 
-        context_parts.append(f"[Source: {source} | Page: {page}]\n{content}")
+        part = f"[Source: {source} | Page: {page}]\n{content}"
+        tokens = estimate_tokens(part)
+        if used + tokens > token_budget:
+            remaining = token_budget - used - estimate_tokens(f"[Source: {source} | Page: {page}]")
+            if remaining < MIN_CHUNK_TOKENS:
+                continue
+            content = _trim_to_tokens(content, remaining)
+            part = f"[Source: {source} | Page: {page}]\n{content}"
+            tokens = estimate_tokens(part)
+
+        context_parts.append(part)
+        used += tokens
 
         used_chunks.append({
+            "id": chunk.get("id"),
             "source": source,
             "page": page,
             "content": content
         })
 
-    context = "\n\n---\n\n".join(context_parts)
-
+    return context_parts, used_chunks, used
+
+
+def summarize_history(chat_history, token_budget):
+    """The last messages as "Role: text" lines, newest kept first, within `token_budget`.
+
+    The oldest message that only partly fits is trimmed, so one long answer
+    cannot crowd the retrieved documents out of the prompt.
+    """
+    lines = []
+    used = 0
+    for msg in reversed(chat_history[-8:]):
+        role = "User" if msg["role"] == "user" else "Assistant"
+        line = f"{role}: {msg['content']}"
+        tokens = estimate_tokens(line)
+        if used + tokens > token_budget:
+            remaining = token_budget - used - estimate_tokens(f"{role}:")
+            if remaining > 0:
+                trimmed = _trim_to_tokens(msg["content"], remaining)
+                if trimmed:
+                    lines.append(f"{role}: {trimmed}")
+            break
+        lines.append(line)
+        used += tokens
+    return "\n".join(reversed(lines))
+
+
+def build_answer_request(query, relevant_chunks, chat_history=None):
     conversation_summary = ""
     if chat_history and len(chat_history) > 1:
-        recent = chat_history[-8:]
-        conv_lines = []
-        for msg in recent:
-            role = "User" if msg["role"] == "user" else "Assistant"
-            conv_lines.append(f"{role}: {msg['content']}")
-        conversation_summary = "\n".join(conv_lines)
+        conversation_summary = summarize_history(
+            chat_history,
+            int((PROMPT_TOKEN_BUDGET - ANSWER_MAX_TOKENS) * HISTORY_TOKEN_SHARE)
+        )
+
+    history = conversation_summary if conversation_summary else "No previous conversation"
+    fixed_tokens = (
+        estimate_tokens(SYSTEM_PROMPT)
+        + estimate_tokens(USER_PROMPT_TEMPLATE.format(history=history, context="", query=query))
+        + ANSWER_MAX_TOKENS
+    )
+    context_parts, used_chunks, context_tokens = pack_context(
+        relevant_chunks,
+        PROMPT_TOKEN_BUDGET - fixed_tokens
+    )
+    context = "\n\n---\n\n".join(context_parts)
+
+    logger.info(
+        "Prompt: ~%d tokens (%d context in %d/%d chunks, %d fixed incl. %d reserved for output)",
+        fixed_tokens + context_tokens, context_tokens, len(used_chunks), len(relevant_chunks),
+        fixed_tokens, ANSWER_MAX_TOKENS
+    )
+    annotate_span(
+        prompt_tokens_est=fixed_tokens + context_tokens - ANSWER_MAX_TOKENS,
+        context_tokens_est=context_tokens,
+        context_chunks=len(used_chunks),
+        candidate_chunks=len(relevant_chunks)
+    )
 
     data = {
         "model": GROQ_MODEL,
         "messages": [
-            {
-                "role": "system",
-                "content": """You are a highly accurate and professional assistant for the Master Biomedical Engineering (MBE) program at Hochschule Anhalt.
-CRITICAL RULES:
+            {"role": "system", "content": SYSTEM_PROMPT},
+            {"role": "user", "content": USER_PROMPT_TEMPLATE.format(history=history, context=context, query=query)}
+        ],
+        "temperature": 0.05,
+        "max_tokens": ANSWER_MAX_TOKENS,
+    }
 
-- Answer EXCLUSIVELY based on the provided document sources or previous conversation history.
-- If the question is a follow-up (e.g., "summarize that", "explain more", "what about X"), use the conversation history FIRST.
-- If no relevant information exists: Reply exactly "No sufficient information in the available documents."
-- Use the SAME language as the user's question (English, German, or Arabic).
-- Be concise, clear, and professional. Use bullet points or numbering when listing items.
-- Always cite sources briefly (e.g., "According to SPO MBE 2024, page X...").
-- NEVER hallucinate, explain your reasoning, or add external knowledge.
-- For summarization requests of entire documents (e.g., module handbook, SPO): Provide a high-level overview including program duration, total credits, main modules/specializations, semester structure, and key regulations, based on extracted information from sources.
-- Always use bullet points or numbered lists for summaries.
-- Cite multiple pages/sources where possible.
-- When asked about Master's thesis registration or regulations, prioritize information from "94_B14_SPO_MBE..." or "Notes_on_final_theses..." documents.
-- For module handbook summaries, list key modules, their credits, and semester distribution if available.
-- For counting or lists: Be precise and complete.
--If a catalog contains both an outline (e.g., WPM codes) and a detailed list of modules, always prefer the detailed module list when the user asks for module names.
-"""
-            },
-            {
-                "role": "user",
-                "content": f"""CONVERSATION HISTORY (for follow-ups only):
-{conversation_summary if conversation_summary else "No previous conversation"}
+    return data, used_chunks
 
-DOCUMENT SOURCES:
-{context}
 
-CURRENT QUESTION: {query}
+def answer_cache_key(query, used_chunks, chat_history=None):
+    """Key for the answer cache, or None when the answer must not be cached.
 
-ANSWER directly and precisely:"""
-            }
-        ],
-        "temperature": 0.05,
-        "max_tokens": 1500,
+    Follow-up turns are never cached: the prompt carries the chat history.
+    """
+    if chat_history and len(chat_history) > 1:
+        return None
+    chunk_ids = [c.get("id") for c in used_chunks]
+    if not chunk_ids or None in chunk_ids:
+        return None
+    catalog = get_catalog() or {}
+    raw = "\x1f".join([
+        normalize_query(query),
+        detect_language(query),
+        GROQ_MODEL,
+        catalog.get("version", ""),
+        ",".join(chunk_ids),
+    ])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+def get_cached_answer(key):
+    if key is None:
+        return None
+    entry = answer_cache.get(key)
+    if entry is None or time.time() - entry["created"] > ANSWER_CACHE_TTL:
+        return None
+    return entry
+
+
+def put_cached_answer(key, answer, used_chunks):
+    if key is not None and answer:
+        answer_cache.put(key, {"answer": answer, "used_chunks": used_chunks, "created": time.time()})
+
+
+def answer_question_with_groq(query, relevant_chunks, chat_history=None, session=None):
+    with span("answer", stream=False) as answer_span:
+        data, used_chunks = build_answer_request(query, relevant_chunks, chat_history)
+        cache_key = answer_cache_key(query, used_chunks, chat_history)
+        cached = get_cached_answer(cache_key)
+        answer_span.set(cache_hit=bool(cached))
+        if cached:
+            return cached["answer"], cached["used_chunks"]
+
+        try:
+            response = chat_completion(data, timeout=60, kind="answer", session=session)
+
+            body = response.json()
+            answer = body["choices"][0]["message"]["content"].strip()
+            answer_span.set(**_usage_attrs(body.get("usage")))
+            put_cached_answer(cache_key, answer, used_chunks)
+            return answer, used_chunks
+
+        except RateLimitExceeded as e:
+            answer_span.set(error="rate_limited")
+            return _rate_limit_message(e.wait_seconds), []
+
+        except requests.exceptions.HTTPError as e:
+            answer_span.set(error=f"HTTP {e.response.status_code if e.response is not None else '?'}")
+            return _http_error_message(e), []
+
+        except Exception as e:
+            answer_span.set(error=str(e))
+            return f"❌ Error: {str(e)}", []
+
+
+def _usage_attrs(usage):
+    if not usage:
+        return {}
+    return {
+        "prompt_tokens": usage.get("prompt_tokens"),
+        "completion_tokens": usage.get("completion_tokens"),
+        "total_tokens": usage.get("total_tokens"),
     }
 
-    try:
-        response = requests.post(
-            "https://api.groq.com/openai/v1/chat/completions",
-            headers={
-                "Authorization": f"Bearer {GROQ_API_KEY}",
-                "Content-Type": "application/json"
-            },
-            json=data,
-            timeout=60
-        )
-        response.raise_for_status()
 
-        return response.json()["choices"][0]["message"]["content"].strip(), used_chunks
+def _rate_limit_message(wait_seconds):
+    return (
+        f"⛔ Groq rate limit reached.\n"
+        f"⏳ The next slot opens in about {int(wait_seconds) + 1} seconds; please try again then."
+    )
 
-    except requests.exceptions.HTTPError as e:
-        if e.response is not None and e.response.status_code == 429:
-            retry_after = e.response.headers.get("Retry-After")
-            wait_time = int(retry_after) if retry_after else 60
 
-            GROQ_RATE_LIMIT_UNTIL = time.time() + wait_time
+def _http_error_message(e):
+    if e.response is not None and e.response.status_code == 429:
+        retry_after = e.response.headers.get("Retry-After")
+        return _rate_limit_message(float(retry_after) if retry_after else 60)
 
-            return (
-                f"⛔ Groq rate limit reached.\n"
-                f"⏳ Please wait {wait_time} seconds before trying again.",
-                []
-            )
+    return f"❌ HTTP Error: {str(e)}"
 
-        return f"❌ HTTP Error: {str(e)}", []
 
+def _iter_sse_tokens(response, on_complete=None, answer_span=None):
+    pieces = []
+    try:
+        for line in response.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data:"):
+                continue
+            payload = line[len("data:"):].strip()
+            if payload == "[DONE]":
+                break
+            event = json.loads(payload)
+            # Groq reports usage on the final chunk under x_groq.
+            usage = event.get("usage") or (event.get("x_groq") or {}).get("usage")
+            if usage and answer_span is not None:
+                answer_span.set(**_usage_attrs(usage))
+            choices = event.get("choices") or []
+            if choices:
+                token = choices[0].get("delta", {}).get("content")
+                if token:
+                    if not pieces and answer_span is not None:
+                        answer_span.set(first_token_seconds=time.perf_counter() - answer_span.started)
+                    pieces.append(token)
+                    yield token
     except Exception as e:
-        return f"❌ Error: {str(e)}", []
-
-import re
+        if answer_span is not None:
+            answer_span.set(error=f"stream interrupted: {e}")
+        yield f"\n\n❌ Stream interrupted: {str(e)}"
+    else:
+        if on_complete:
+            on_complete("".join(pieces).strip())
+    finally:
+        response.close()
+        if answer_span is not None:
+            answer_span.end(streamed_pieces=len(pieces))
+
+
+def stream_answer_with_groq(query, relevant_chunks, chat_history=None, session=None):
+    """Streaming variant of answer_question_with_groq.
+
+    Returns (tokens, used_chunks) where `tokens` is a generator of text pieces
+    suitable for st.write_stream. The request is sent before returning, so
+    errors surface as a one-item stream with no used chunks.
+    """
+    # The span stays open until the token stream is exhausted or closed.
+    answer_span = start_span("answer", stream=True)
+    with use_span(answer_span):
+        data, used_chunks = build_answer_request(query, relevant_chunks, chat_history)
+        cache_key = answer_cache_key(query, used_chunks, chat_history)
+        cached = get_cached_answer(cache_key)
+        if cached:
+            answer_span.end(cache_hit=True)
+            return iter([cached["answer"]]), cached["used_chunks"]
+        answer_span.set(cache_hit=False)
+
+        data["stream"] = True
+
+        try:
+            response = chat_completion(data, timeout=60, stream=True, kind="answer_stream", session=session)
+
+        except RateLimitExceeded as e:
+            answer_span.end(error="rate_limited")
+            return iter([_rate_limit_message(e.wait_seconds)]), []
+
+        except requests.exceptions.HTTPError as e:
+            answer_span.end(error=f"HTTP {e.response.status_code if e.response is not None else '?'}")
+            return iter([_http_error_message(e)]), []
+
+        except Exception as e:
+            answer_span.end(error=str(e))
+            return iter([f"❌ Error: {str(e)}"]), []
+
+    return _iter_sse_tokens(
+        response,
+        on_complete=lambda answer: put_cached_answer(cache_key, answer, used_chunks),
+        answer_span=answer_span
+    ), used_chunks
 
 def detect_language(text):
     text = text.lower()
@@ -144,6 +378,10 @@ def detect_language(text):
     return "ar"
 
 def get_available_languages(collection):
+    catalog = get_catalog()
+    if catalog is not None:
+        return list(catalog["languages"])
+
     langs = set()
     metas = collection.get(include=["metadatas"])["metadatas"]
     for m in metas:
@@ -151,10 +389,27 @@ def get_available_languages(collection):
             langs.add(m["lang"])
     return list(langs)
 
-def translate_query(query, source_lang, target_lang):
+def normalize_query(query):
+    return re.sub(r'\s+', ' ', query).strip().casefold()
+
+def translation_cache_key(query, source_lang, target_lang, model=GROQ_MODEL):
+    raw = "\x1f".join([normalize_query(query), source_lang, target_lang, model])
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def translate_query(query, source_lang, target_lang, session=None):
     if source_lang == target_lang:
         return query
 
+    with span("translate", source_lang=source_lang, target_lang=target_lang) as translate_span:
+        return _translate_query(query, source_lang, target_lang, session, translate_span)
+
+def _translate_query(query, source_lang, target_lang, session, translate_span):
+    key = translation_cache_key(query, source_lang, target_lang)
+    cached = translation_cache.get(key)
+    translate_span.set(cache_hit=cached is not None)
+    if cached is not None:
+        return cached
+
     prompt = f"""
 Translate the following question from {source_lang} to {target_lang}.
 Keep it accurate, literal, and academic.
@@ -164,30 +419,40 @@ Question:
 {query}
 """
 
-    response = requests.post(
-        "https://api.groq.com/openai/v1/chat/completions",
-        headers={
-            "Authorization": f"Bearer {GROQ_API_KEY}",
-            "Content-Type": "application/json"
-        },
-        json={
-            "model": GROQ_MODEL,
-            "messages": [{"role": "user", "content": prompt}],
-            "temperature": 0
-        },
-        timeout=30
-    )
+    try:
+        response = chat_completion(
+            {
+                "model": GROQ_MODEL,
+                "messages": [{"role": "user", "content": prompt}],
+                "temperature": 0
+            },
+            timeout=30,
+            kind="translate",
+            session=session,
+            max_wait=TRANSLATION_MAX_QUEUE_WAIT
+        )
+        body = response.json()
+        translated = body["choices"][0]["message"]["content"].strip()
+        translate_span.set(**_usage_attrs(body.get("usage")))
+    except Exception as e:
+        # Retrieval still works on the untranslated query.
+        translate_span.set(error=str(e), fallback=True)
+        return query
 
-    return response.json()["choices"][0]["message"]["content"].strip()
+    translation_cache.put(key, translated)
+    return translated
 
-def expand_query_multilingual(query, collection):
+def submit_translations(query, collection, session=None):
+    """Start one translation per corpus language on the shared pool; returns {lang: future}."""
     user_lang = detect_language(query)
-    doc_langs = get_available_languages(collection)
-
-    expanded_queries = []
-    for lang in doc_langs:
-        expanded_queries.append(
-            translate_query(query, user_lang, lang)
+    return {
+        # A copied context carries the current trace into the pool thread.
+        lang: translation_executor.submit(
+            contextvars.copy_context().run, translate_query, query, user_lang, lang, session
         )
+        for lang in get_available_languages(collection)
+    }
 
-    return expanded_queries
+def expand_query_multilingual(query, collection, session=None):
+    futures = submit_translations(query, collection, session)
+    return [future.result() for future in futures.values()]
@@ -0,0 +1,338 @@
+"""asyncio HTTP service for query expansion, retrieval and answering.
+
+    python ChatService.py            # listens on CHAT_SERVICE_HOST:CHAT_SERVICE_PORT
+
+Without CHAT_SERVICE_URL, ChatClient starts it inside the Streamlit process
+instead (see start_background).
+
+One process holds the Chroma client, the embedding and rerank models, the
+translation/answer caches and the Groq connection pool for every session.
+Blocking library calls (Chroma, sentence-transformers, requests) run on a
+bounded worker pool so the event loop keeps serving other sessions.
+
+Endpoints:
+    GET  /health     index size, catalog version, model load, Groq queue and stage latency stats
+    GET  /metrics    per-stage p50/p95 and latency histograms, LLM call and queue stats
+    GET  /trace      {"session_id"} -> spans of that session's last turn
+    POST /expand     {"query", "session_id"} -> {"queries"}
+    POST /retrieve   {"query", "n_results", "session_id"} -> {"queries", "chunks", "trace"}
+    POST /answer     {"query", "chat_history", "n_results", "stream", "session_id"}
+                     streamed as NDJSON events: context, token..., done (with the trace)
+    POST /sync       re-sync the index with DOCS_FOLDER
+
+An index rebuilt by `python ingest.py` while the service runs is picked up
+on the next request: a new catalog version reopens the Chroma client, and
+the catalog and BM25 index reload when their files change.
+
+Every turn is traced (see Tracing.py) and appended to TRACE_FILE as JSONL.
+"""
+import os
+import json
+import asyncio
+import logging
+import functools
+import threading
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+
+import chromadb
+from aiohttp import web
+from chromadb.api.client import SharedSystemClient
+
+from DocumentProcessor import get_files_from_folder
+from IndexManager import CHROMA_FOLDER, get_catalog, open_collection, open_prebuilt_collection, sync_collection
+from ChatEngine import (
+    get_embedding_function,
+    expand_query_multilingual,
+    answer_question_with_groq,
+    stream_answer_with_groq,
+)
+from Retriever import retrieve_multilingual
+from Reranker import rerank
+from Embeddings import get_embedding_stats
+from LLMClient import get_latency_stats, get_scheduler_stats
+from Tracing import get_last_trace, get_stage_stats, trace_turn
+
+CHAT_SERVICE_HOST = os.getenv("CHAT_SERVICE_HOST", "127.0.0.1")
+CHAT_SERVICE_PORT = int(os.getenv("CHAT_SERVICE_PORT", "8000"))
+SERVICE_WORKERS = int(os.getenv("SERVICE_WORKERS", "16"))
+DEFAULT_N_RESULTS = 10
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=SERVICE_WORKERS, thread_name_prefix="service")
+_client = None
+_collection = None
+_index_version = None
+_sync_lock = asyncio.Lock()
+_reload_lock = asyncio.Lock()
+
+
+def run_blocking(func, *args, **kwargs):
+    """Run a blocking call on the shared worker pool and await its result.
+
+    The call runs in a copy of the caller's context, so spans land in the
+    request's trace.
+    """
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return loop.run_in_executor(_executor, functools.partial(context.run, func, *args, **kwargs))
+
+
+def _chunk_json(chunk):
+    return {"id": chunk["id"], "content": chunk["content"], "metadata": chunk["metadata"]}
+
+
+async def _read_query(request):
+    try:
+        body = await request.json()
+    except json.JSONDecodeError:
+        raise web.HTTPBadRequest(text="Request body must be JSON")
+    if not isinstance(body, dict):
+        raise web.HTTPBadRequest(text="Request body must be a JSON object")
+    query = body.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise web.HTTPBadRequest(text="Missing 'query'")
+    return query.strip(), body
+
+
+def _n_results(body):
+    try:
+        n_results = int(body.get("n_results", DEFAULT_N_RESULTS))
+    except (TypeError, ValueError):
+        raise web.HTTPBadRequest(text="'n_results' must be an integer")
+    if n_results < 1:
+        raise web.HTTPBadRequest(text="'n_results' must be positive")
+    return n_results
+
+
+def _catalog_version():
+    return (get_catalog() or {}).get("version")
+
+
+def _open_index():
+    # A live client's query index does not see another process's writes, so
+    # the cached system is dropped and the store opened afresh.
+    SharedSystemClient.clear_system_cache()
+    client = chromadb.PersistentClient(path=CHROMA_FOLDER)
+    collection, _ = open_prebuilt_collection(client, get_embedding_function())
+    return client, collection
+
+
+async def _reload_if_reingested():
+    global _client, _collection, _index_version
+    if _catalog_version() == _index_version or _sync_lock.locked():
+        return
+    async with _reload_lock:
+        version = _catalog_version()
+        if version == _index_version:
+            return
+        _client, _collection = await run_blocking(_open_index)
+        _index_version = version
+        logger.info("Reopened the document index (catalog version %s)", version)
+
+
+async def _require_collection():
+    await _reload_if_reingested()
+    if _collection is None or not _collection.count():
+        raise web.HTTPServiceUnavailable(text="No document index found. Run `python ingest.py` first.")
+    return _collection
+
+
+async def _retrieve(query, n_results, session):
+    collection = await _require_collection()
+    queries, chunks = await run_blocking(
+        retrieve_multilingual, query, collection, n_results=n_results, session=session
+    )
+    chunks = await run_blocking(rerank, query, chunks)
+    return queries, chunks
+
+
+async def health(request):
+    await _reload_if_reingested()
+    catalog = get_catalog() or {}
+    return web.json_response({
+        "status": "ok",
+        "chunks": _collection.count() if _collection is not None else 0,
+        "catalog_version": catalog.get("version"),
+        "embedding": get_embedding_stats(),
+        "llm": get_latency_stats(),
+        "scheduler": get_scheduler_stats(),
+        "stages": get_stage_stats(),
+    })
+
+
+async def metrics(request):
+    return web.json_response({
+        "stages": get_stage_stats(),
+        "llm": get_latency_stats(),
+        "scheduler": get_scheduler_stats(),
+    })
+
+
+async def trace(request):
+    return web.json_response({"trace": get_last_trace(request.query.get("session_id"))})
+
+
+async def expand(request):
+    query, body = await _read_query(request)
+    queries = await run_blocking(
+        expand_query_multilingual, query, await _require_collection(), body.get("session_id")
+    )
+    return web.json_response({"queries": queries})
+
+
+async def retrieve(request):
+    query, body = await _read_query(request)
+    n_results = _n_results(body)
+    session = body.get("session_id")
+    with trace_turn("retrieve", session=session) as turn:
+        queries, chunks = await _retrieve(query, n_results, session)
+    return web.json_response({
+        "queries": queries,
+        "chunks": [_chunk_json(c) for c in chunks],
+        "trace": turn.to_dict(),
+    })
+
+
+async def _write_event(response, event):
+    await response.write((json.dumps(event, ensure_ascii=False) + "\n").encode("utf-8"))
+
+
+async def answer(request):
+    query, body = await _read_query(request)
+    n_results = _n_results(body)
+    history = body.get("chat_history") or []
+    if not isinstance(history, list) or not all(
+        isinstance(m, dict) and isinstance(m.get("role"), str) and isinstance(m.get("content"), str) for m in history
+    ):
+        raise web.HTTPBadRequest(text="'chat_history' must be a list of messages")
+    session = body.get("session_id")
+    stream = body.get("stream", True)
+
+    if not stream:
+        with trace_turn("answer", session=session, stream=False) as turn:
+            queries, chunks = await _retrieve(query, n_results, session)
+            text, used_chunks = await run_blocking(answer_question_with_groq, query, chunks, history, session)
+        return web.json_response({
+            "queries": queries,
+            "chunks": [_chunk_json(c) for c in chunks],
+            "used_chunks": used_chunks,
+            "answer": text,
+            "trace": turn.to_dict(),
+        })
+
+    response = web.StreamResponse(headers={"Content-Type": "application/x-ndjson"})
+    try:
+        with trace_turn("answer", session=session, stream=True) as turn:
+            queries, chunks = await _retrieve(query, n_results, session)
+            tokens, used_chunks = await run_blocking(stream_answer_with_groq, query, chunks, history, session)
+
+            await response.prepare(request)
+            try:
+                await _write_event(response, {
+                    "type": "context",
+                    "queries": queries,
+                    "chunks": [_chunk_json(c) for c in chunks],
+                    "used_chunks": used_chunks,
+                })
+                while True:
+                    token = await run_blocking(next, tokens, None)
+                    if token is None:
+                        break
+                    await _write_event(response, {"type": "token", "text": token})
+            finally:
+                close = getattr(tokens, "close", None)
+                if close:
+                    await run_blocking(close)
+        await _write_event(response, {"type": "done", "trace": turn.to_dict()})
+    except ConnectionResetError:
+        logger.info("Client went away while streaming an answer")
+    return response
+
+
+async def sync(request):
+    global _collection, _index_version
+    if _sync_lock.locked():
+        raise web.HTTPConflict(text="A sync is already running")
+
+    async with _sync_lock:
+        files = get_files_from_folder()
+        messages = []
+
+        def report(level, message):
+            messages.append({"level": level, "message": message})
+
+        def run_sync():
+            collection, manifest = open_collection(_client, get_embedding_function())
+            return collection, sync_collection(collection, manifest, files, progress=report)
+
+        _collection, summary = await run_blocking(run_sync)
+        _index_version = _catalog_version()
+
+    return web.json_response({"summary": summary, "messages": messages})
+
+
+async def on_startup(app):
+    global _client, _collection, _index_version
+    os.makedirs(CHROMA_FOLDER, exist_ok=True)
+    _index_version = _catalog_version()
+    _client, _collection = await run_blocking(_open_index)
+    if _collection is None:
+        logger.warning("No document index in %s; run `python ingest.py`", CHROMA_FOLDER)
+
+
+async def on_cleanup(app):
+    _executor.shutdown(wait=False, cancel_futures=True)
+
+
+def create_app():
+    app = web.Application()
+    app.add_routes([
+        web.get("/health", health),
+        web.get("/metrics", metrics),
+        web.get("/trace", trace),
+        web.post("/expand", expand),
+        web.post("/retrieve", retrieve),
+        web.post("/answer", answer),
+        web.post("/sync", sync),
+    ])
+    app.on_startup.append(on_startup)
+    app.on_cleanup.append(on_cleanup)
+    return app
+
+
+def start_background(host="127.0.0.1", port=0):
+    """Serve the app on its own event loop in a daemon thread of this process.
+
+    Blocks until the server is listening and returns its base URL; `port` 0
+    picks a free port. Startup errors are raised in the caller.
+    """
+    ready = threading.Event()
+    result = {}
+
+    def run():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        runner = web.AppRunner(create_app())
+        try:
+            loop.run_until_complete(runner.setup())
+            loop.run_until_complete(web.TCPSite(runner, host, port).start())
+            result["url"] = f"http://{host}:{runner.addresses[0][1]}"
+        except Exception as e:
+            result["error"] = e
+            return
+        finally:
+            ready.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, name="chat-service", daemon=True).start()
+    ready.wait()
+    if "error" in result:
+        raise result["error"]
+    return result["url"]
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    web.run_app(create_app(), host=CHAT_SERVICE_HOST, port=CHAT_SERVICE_PORT)
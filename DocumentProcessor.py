@@ -1,10 +1,20 @@
 import streamlit as st
 import re
 import fitz
+import docx
+from docx.oxml.ns import qn
+from docx.table import Table
+from docx.text.paragraph import Paragraph
 import glob
 import os
-import pickle
+import json
+import zlib
+import time
 import hashlib
+import numpy as np
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -12,9 +22,28 @@ load_dotenv()
 PDF_PASSWORD = os.getenv("PDF_PASSWORD", "")
 DOCS_FOLDER = "/mount/src/lasst/documents"
 CACHE_FOLDER = os.getenv("CACHE_FOLDER", "./cache")
+PDF_WORKERS = int(os.getenv("PDF_WORKERS", "1"))
+PDF_PAGES_PER_TASK = int(os.getenv("PDF_PAGES_PER_TASK", "4"))
+EXTRACT_WINDOW = int(os.getenv("EXTRACT_WINDOW", "2"))
+OCR_DPI = int(os.getenv("OCR_DPI", "300"))
+OCR_LANGUAGE = os.getenv("OCR_LANGUAGE", "eng")
+OCR_CACHE_FOLDER = os.path.join(CACHE_FOLDER, "ocr")
+PAGE_TEXT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+# "on" skips find_tables on pages without rulings, "off" always runs it,
+# "validate" always runs it and records pages the pre-filter would have missed.
+TABLE_PREFILTER = os.getenv("TABLE_PREFILTER", "on")
+TABLE_MIN_RULINGS = int(os.getenv("TABLE_MIN_RULINGS", "2"))
+TABLE_MIN_RULING_LENGTH = float(os.getenv("TABLE_MIN_RULING_LENGTH", "5"))
+
+# Part of every cache key: bump EXTRACTOR_VERSION when extraction output
+# changes and CHUNKER_VERSION when chunk boundaries or metadata change.
+CACHE_FORMAT_VERSION = 1
+EXTRACTOR_VERSION = 7
+CHUNKER_VERSION = 1
 
 os.makedirs(DOCS_FOLDER, exist_ok=True)
 os.makedirs(CACHE_FOLDER, exist_ok=True)
+os.makedirs(OCR_CACHE_FOLDER, exist_ok=True)
 
 def detect_doc_language(filename):
     name = filename.lower()
@@ -31,24 +60,58 @@ def get_file_hash(filepath):
             hash_md5.update(chunk)
     return hash_md5.hexdigest()
 
-def load_cache(cache_key):
-    cache_file = os.path.join(CACHE_FOLDER, f"{cache_key}.pkl")
-    if os.path.exists(cache_file):
-        try:
-            with open(cache_file, 'rb') as f:
-                return pickle.load(f)
-        except:
-            return None
-    return None
-
-def save_cache(cache_key, data):
-    cache_file = os.path.join(CACHE_FOLDER, f"{cache_key}.pkl")
+def make_cache_key(file_hash, ext):
+    return f"{file_hash}_{ext}_f{CACHE_FORMAT_VERSION}_x{EXTRACTOR_VERSION}_c{CHUNKER_VERSION}"
+
+def _cache_path(cache_key):
+    return os.path.join(CACHE_FOLDER, f"{cache_key}.npz")
+
+def load_cache(cache_key, with_embeddings=False):
+    """Load a cached file_info; chunk embeddings are only read when asked for.
+
+    The .npz members are plain byte/float arrays, so nothing is unpickled.
+    """
+    cache_file = _cache_path(cache_key)
+    if not os.path.exists(cache_file):
+        return None
+    try:
+        with np.load(cache_file, allow_pickle=False) as data:
+            info = json.loads(data["info"].tobytes().decode("utf-8"))
+            info['chunks'] = json.loads(zlib.decompress(data["chunks"].tobytes()).decode("utf-8"))
+            if with_embeddings and "embeddings" in data.files:
+                info['embeddings'] = data["embeddings"]
+        return info
+    except Exception:
+        return None
+
+def save_cache(cache_key, data, embeddings=None, embedding_model=None):
+    cache_file = _cache_path(cache_key)
+    info = {k: v for k, v in data.items() if k not in ('chunks', 'embeddings')}
+    info['format_version'] = CACHE_FORMAT_VERSION
+    info['extractor_version'] = EXTRACTOR_VERSION
+    info['chunker_version'] = CHUNKER_VERSION
+    arrays = {
+        "chunks": np.frombuffer(
+            zlib.compress(json.dumps(data['chunks'], ensure_ascii=False).encode("utf-8"), 6),
+            dtype=np.uint8
+        ),
+    }
+    if embeddings is not None:
+        info['embedding_model'] = embedding_model
+        arrays["embeddings"] = np.asarray(embeddings, dtype=np.float16)
+    arrays["info"] = np.frombuffer(json.dumps(info).encode("utf-8"), dtype=np.uint8)
     try:
-        with open(cache_file, 'wb') as f:
-            pickle.dump(data, f)
+        tmp_file = cache_file + ".tmp.npz"
+        np.savez(tmp_file, **arrays)
+        os.replace(tmp_file, cache_file)
     except Exception as e:
         st.warning(f"⚠️ Cache save error: {str(e)}")
 
+def save_cache_embeddings(cache_key, embeddings, embedding_model):
+    info = load_cache(cache_key)
+    if info is not None and len(info['chunks']) == len(embeddings):
+        save_cache(cache_key, info, embeddings, embedding_model)
+
 def clean_text(text):
     text = re.sub(r'\s+', ' ', text).strip()
     return text
@@ -108,157 +171,456 @@ def format_table_as_structured_text(table, table_number=None):
             text += "| " + " | ".join(cells) + " |\n"
     return text
 
-def extract_pdf_detailed(filepath):
+def open_pdf(filepath):
     try:
         doc = fitz.open(filepath)
         if doc.is_encrypted and not doc.authenticate(PDF_PASSWORD):
+            doc.close()
             return None, "❌ Wrong PDF password"
     except Exception as e:
         return None, f"❌ PDF open error: {str(e)}"
+    return doc, None
+
+def _text_blocks(textpage_dict):
+    # Keep only what page assembly reads, so OCR results can be cached as JSON.
+    return [
+        {"type": 0, "lines": [
+            {"spans": [{"text": span.get("text", "")} for span in line.get("spans", [])]}
+            for line in block.get("lines", [])
+        ]}
+        for block in textpage_dict["blocks"]
+        if block.get("type") == 0
+    ]
+
+def _ocr_cache_path(page):
+    # The page is hashed from a cheap 72 dpi render; the OCR resolution is part of the key.
+    pix = page.get_pixmap(dpi=72)
+    digest = hashlib.sha256(pix.samples).hexdigest()
+    key = f"{digest}_{pix.width}x{pix.height}_partial_{OCR_DPI}_{OCR_LANGUAGE}"
+    return os.path.join(OCR_CACHE_FOLDER, f"{key}.json")
+
+def ocr_page_blocks(page):
+    """Native text blocks plus Tesseract text for the page's images, cached by rendered-image hash."""
+    cache_file = _ocr_cache_path(page)
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, "r", encoding="utf-8") as f:
+                return json.load(f)
+        except Exception:
+            pass
+
+    textpage = page.get_textpage_ocr(
+        flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE,
+        language=OCR_LANGUAGE,
+        dpi=OCR_DPI,
+        full=False,
+        # tessdata=r"C:\Program Files\Tesseract-OCR\tessdata"
+    )
+    blocks = _text_blocks(page.get_text("dict", textpage=textpage))
+
+    try:
+        tmp_file = cache_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(blocks, f, ensure_ascii=False)
+        os.replace(tmp_file, cache_file)
+    except OSError:
+        pass
+    return blocks
+
+def page_may_have_tables(page, drawings=None):
+    """Cheap stand-in for find_tables: does the page have horizontal and vertical rulings?
+
+    The default "lines" table strategy needs both, so pages without them are
+    skipped. Filled rectangles count as two rulings in each direction.
+    """
+    horizontal = vertical = 0
+    for path in page.get_drawings() if drawings is None else drawings:
+        for item in path["items"]:
+            if item[0] == "l":
+                p1, p2 = item[1], item[2]
+                if abs(p1.y - p2.y) < 1 and abs(p1.x - p2.x) >= TABLE_MIN_RULING_LENGTH:
+                    horizontal += 1
+                elif abs(p1.x - p2.x) < 1 and abs(p1.y - p2.y) >= TABLE_MIN_RULING_LENGTH:
+                    vertical += 1
+            elif item[0] == "re":
+                rect = item[1]
+                if rect.height < 3 and rect.width >= TABLE_MIN_RULING_LENGTH:
+                    horizontal += 1
+                elif rect.width < 3 and rect.height >= TABLE_MIN_RULING_LENGTH:
+                    vertical += 1
+                elif rect.width >= TABLE_MIN_RULING_LENGTH and rect.height >= TABLE_MIN_RULING_LENGTH:
+                    horizontal += 2
+                    vertical += 2
+            if horizontal >= TABLE_MIN_RULINGS and vertical >= TABLE_MIN_RULINGS:
+                return True
+    return False
+
+def extract_pdf_page(page, filename, page_num, table_prefilter=None):
+    # One textpage feeds both the scanned-page check and the block layout;
+    # OCR runs only when the page has (almost) no text layer, and then only
+    # over its images, so what native text there is stays as extracted.
+    started = time.perf_counter()
+    timings = {'text': 0.0, 'tables': 0.0, 'ocr': 0.0}
+    table_prefilter = table_prefilter or TABLE_PREFILTER
+    textpage = page.get_textpage(flags=PAGE_TEXT_FLAGS)
+    native_text = textpage.extractText().strip()
+    is_scanned = len(native_text) < 100
+    if is_scanned:
+        timings['text'] += time.perf_counter() - started
+        ocr_started = time.perf_counter()
+        blocks = ocr_page_blocks(page)
+        timings['ocr'] = time.perf_counter() - ocr_started
+        started = time.perf_counter()
+    else:
+        blocks = page.get_text("dict", textpage=textpage)["blocks"]
+
+    page_text = f"# {filename} - Page {page_num + 1}\n\n"
+
+    last_text_block = ""  
+
+    for block in blocks:
+        if block.get("type") == 0:
+            block_text = ""
+            for line in block.get("lines", []):
+                for span in line.get("spans", []):
+                    block_text += span.get("text", "")
+            block_text = block_text.strip()
+
+            if block_text:
+                structured = structure_text_into_paragraphs(block_text)
+                page_text += structured + "\n\n"
+                last_text_block = structured  
+
+    timings['text'] += time.perf_counter() - started
+    started = time.perf_counter()
+    tables = []
+    table_check = {'skipped': False, 'missed': False}
+    # find_tables reads the native text layer, so on a page without one it can
+    # only produce empty cells. Sparse pages (forms, number grids) still have one.
+    if not native_text:
+        found = None
+    elif table_prefilter == "off":
+        found = page.find_tables()
+    else:
+        # find_tables would extract the vector graphics again; hand it the pre-filter's.
+        drawings = page.get_drawings()
+        likely = page_may_have_tables(page, drawings)
+        found = page.find_tables(paths=drawings) if likely or table_prefilter == "validate" else None
+        table_check['skipped'] = not likely
+        table_check['missed'] = not likely and bool(found and found.tables)
+    if found:
+        for table in found.tables:
+            tables.append(table.extract())
+    timings['tables'] = time.perf_counter() - started
+
+    return {
+        'page_text': page_text,
+        'last_text_block': last_text_block,
+        'tables': tables,
+        'table_check': table_check,
+        'timings': timings,
+    }
+
+def build_pdf_page_chunks(content, filename, page_num, file_info):
+    last_text_block = content['last_text_block']
+
+    prefilter = file_info.setdefault('table_prefilter', {'pages_checked': 0, 'pages_skipped': 0, 'missed_pages': []})
+    prefilter['pages_checked'] += 1
+    if content['table_check']['skipped']:
+        prefilter['pages_skipped'] += 1
+    if content['table_check']['missed']:
+        prefilter['missed_pages'].append(page_num + 1)
+
+    # Seconds spent per extraction step, summed over pages (and worker processes).
+    timings = file_info.setdefault('timings', {'text': 0.0, 'tables': 0.0, 'ocr': 0.0, 'ocr_pages': 0})
+    for step in ('text', 'tables', 'ocr'):
+        timings[step] += content['timings'][step]
+    if content['timings']['ocr']:
+        timings['ocr_pages'] += 1
+
+    for extracted in content['tables']:
+        file_info['total_tables'] += 1
+
+        if extracted:
+            table_text = format_table_as_structured_text(
+                extracted,
+                file_info['total_tables']
+            )
+
+            combined_text = ""
+
+            if last_text_block:
+                last_line = last_text_block.strip().split("\n")[-1].strip()
+
+                if (
+                    not last_line.endswith(".")
+                    or last_line.endswith(":")
+                    or len(last_line.split()) <= 12
+                ):
+                    combined_text += last_text_block + "\n\n"
+
+            combined_text += table_text
+
+            table_chunks = create_smart_chunks(
+                combined_text,
+                chunk_size=1800,
+                overlap=0,
+                page_num=page_num + 1,
+                source_file=filename,
+                is_table=True,
+                table_num=file_info['total_tables']
+            )
+
+            file_info['chunks'].extend(table_chunks)
+
+    page_chunks = create_smart_chunks(
+        content['page_text'],
+        chunk_size=800,
+        overlap=100,
+        page_num=page_num + 1,
+        source_file=filename
+    )
+    file_info['chunks'].extend(page_chunks)
+
+def extract_pdf_page_range(filepath, start, stop, table_prefilter):
+    doc, error = open_pdf(filepath)
+    if error:
+        raise RuntimeError(error)
+    filename = os.path.basename(filepath)
+    try:
+        return [extract_pdf_page(doc[n], filename, n, table_prefilter) for n in range(start, stop)]
+    finally:
+        doc.close()
+
+def assemble_pdf(filename, total_pages, page_contents):
+    file_info = {'chunks': [], 'total_pages': total_pages, 'total_tables': 0}
+    for page_num, content in enumerate(page_contents):
+        build_pdf_page_chunks(content, filename, page_num, file_info)
+    return file_info
+
+def _process_pool(workers):
+    # Pools are created from the ingest pipeline's threads and inside the
+    # service/Streamlit process; forking a multi-threaded process can
+    # deadlock, so workers come from a fork server (spawn where unavailable).
+    # Workers therefore see only the environment, not this process's globals.
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    return ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(method))
+
+def submit_pdf(pool, filepath):
+    """Queue a PDF's page ranges on `pool`; returns (job, error)."""
+    doc, error = open_pdf(filepath)
+    if error:
+        return None, error
+    total_pages = len(doc)
+    doc.close()
+    futures = [
+        pool.submit(
+            extract_pdf_page_range, filepath, start, min(start + PDF_PAGES_PER_TASK, total_pages), TABLE_PREFILTER
+        )
+        for start in range(0, total_pages, PDF_PAGES_PER_TASK)
+    ]
+    return (total_pages, futures), None
+
+def collect_pdf(filepath, job):
+    total_pages, futures = job
+    try:
+        page_contents = []
+        for future in futures:
+            page_contents.extend(future.result())
+        return assemble_pdf(os.path.basename(filepath), total_pages, page_contents), None
+    except Exception as e:
+        return None, f"❌ PDF extraction error: {str(e)}"
+
+def extract_pdfs_parallel(filepaths, workers=None):
+    """Extract several PDFs on a shared process pool, fanning out page ranges.
+
+    Returns (file_info, error) tuples in the order of `filepaths`; chunks are
+    reassembled in page order, so the output matches the serial path.
+    """
+    workers = workers or PDF_WORKERS
+    with _process_pool(workers) as pool:
+        jobs = [submit_pdf(pool, filepath) for filepath in filepaths]
+        return [
+            (None, error) if error else collect_pdf(filepath, job)
+            for filepath, (job, error) in zip(filepaths, jobs)
+        ]
+
+def validate_table_prefilter(filepaths, workers=None):
+    """Run full table detection on every page and report what the pre-filter would skip and miss.
+
+    Changes TABLE_PREFILTER for this process while it runs; submit_pdf passes it on to the workers.
+    """
+    global TABLE_PREFILTER
+    previous, TABLE_PREFILTER = TABLE_PREFILTER, "validate"
+    report = {'files': {}, 'pages_checked': 0, 'pages_skipped': 0, 'pages_missed': 0}
+    try:
+        for filepath in filepaths:
+            info, error = extract_pdf_detailed(filepath, workers)
+            if error:
+                report['files'][os.path.basename(filepath)] = {'error': error}
+                continue
+            stats = info.get('table_prefilter', {'pages_checked': 0, 'pages_skipped': 0, 'missed_pages': []})
+            report['files'][os.path.basename(filepath)] = stats
+            report['pages_checked'] += stats['pages_checked']
+            report['pages_skipped'] += stats['pages_skipped']
+            report['pages_missed'] += len(stats['missed_pages'])
+    finally:
+        TABLE_PREFILTER = previous
+    return report
+
+def extract_pdf_detailed(filepath, workers=None):
+    workers = workers or PDF_WORKERS
+    if workers > 1:
+        return extract_pdfs_parallel([filepath], workers)[0]
+
+    doc, error = open_pdf(filepath)
+    if error:
+        return None, error
 
     filename = os.path.basename(filepath)
     file_info = {'chunks': [], 'total_pages': len(doc), 'total_tables': 0}
 
     for page_num in range(len(doc)):
-        page = doc[page_num]
-
-        text = page.get_text("text")
-        if len(text.strip()) < 100:
-            textpage = page.get_textpage_ocr(
-                flags=fitz.TEXT_PRESERVE_LIGATURES | fitz.TEXT_PRESERVE_WHITESPACE,
-                full=True,
-                # tessdata=r"C:\Program Files\Tesseract-OCR\tessdata"
-            )
-            text = page.get_text("text", textpage=textpage)
-
-        blocks = page.get_text("dict")["blocks"]
-        page_text = f"# {filename} - Page {page_num + 1}\n\n"
-
-        last_text_block = ""  
-
-        for block in blocks:
-            if block.get("type") == 0:
-                block_text = ""
-                for line in block.get("lines", []):
-                    for span in line.get("spans", []):
-                        block_text += span.get("text", "")
-                block_text = block_text.strip()
-
-                if block_text:
-                    structured = structure_text_into_paragraphs(block_text)
-                    page_text += structured + "\n\n"
-                    last_text_block = structured  
-
-        tables = page.find_tables()
-        if tables:
-            for t_num, table in enumerate(tables.tables, 1):
-                file_info['total_tables'] += 1
-                extracted = table.extract()
-
-                if extracted:
-                    table_text = format_table_as_structured_text(
-                        extracted,
-                        file_info['total_tables']
-                    )
-
-                    combined_text = ""
-
-                    if last_text_block:
-                        last_line = last_text_block.strip().split("\n")[-1].strip()
-
-                        if (
-                            not last_line.endswith(".")
-                            or last_line.endswith(":")
-                            or len(last_line.split()) <= 12
-                        ):
-                            combined_text += last_text_block + "\n\n"
-
-                    combined_text += table_text
-
-                    table_chunks = create_smart_chunks(
-                        combined_text,
-                        chunk_size=1800,
-                        overlap=0,
-                        page_num=page_num + 1,
-                        source_file=filename,
-                        is_table=True,
-                        table_num=file_info['total_tables']
-                    )
-
-                    file_info['chunks'].extend(table_chunks)
-
-        page_chunks = create_smart_chunks(
-            page_text,
-            chunk_size=800,
-            overlap=100,
-            page_num=page_num + 1,
-            source_file=filename
-        )
-        file_info['chunks'].extend(page_chunks)
+        content = extract_pdf_page(doc[page_num], filename, page_num)
+        build_pdf_page_chunks(content, filename, page_num, file_info)
 
     doc.close()
     return file_info, None
 
+def _docx_style_names(doc):
+    return {style.style_id: style.name or "" for style in doc.styles}
+
+def _docx_heading(element, style_names):
+    p_pr = element.pPr
+    if p_pr is None or p_pr.pStyle is None:
+        return False
+    name = style_names.get(p_pr.pStyle.val, "")
+    return name.startswith("Heading") or name == "Title"
+
+def _docx_page_sections(body):
+    """The paragraph-level w:sectPr elements whose section break starts a new page.
+
+    A paragraph's sectPr ends its section; how the next section starts is
+    that next section's w:type, and "continuous" keeps it on the same page.
+    """
+    sections = body.findall('./' + qn('w:p') + '/' + qn('w:pPr') + '/' + qn('w:sectPr'))
+    final = body.find('./' + qn('w:sectPr'))
+    following = sections[1:] + [final]
+    page_sections = set()
+    for sect, next_sect in zip(sections, following):
+        start = next_sect.find(qn('w:type')) if next_sect is not None else None
+        if start is None or start.get(qn('w:val')) != 'continuous':
+            page_sections.add(sect)
+    return page_sections
+
+def _docx_page_breaks(element, use_rendered, page_sections):
+    if use_rendered:
+        return len(element.findall('.//' + qn('w:lastRenderedPageBreak')))
+    breaks = sum(1 for br in element.iter(qn('w:br')) if br.get(qn('w:type')) == 'page')
+    if element.find('./' + qn('w:pPr') + '/' + qn('w:sectPr')) in page_sections:
+        breaks += 1
+    return breaks
+
+def iter_docx_chunks(doc, filename, stats):
+    """Walk the DOCX body once and yield chunks as each page's text is complete.
+
+    Pages come from Word's rendered page-break markers when the file has
+    them, otherwise from explicit page and section breaks. Chunks carry
+    the nearest preceding heading as 'section'. `stats` receives
+    'total_pages' and 'total_tables'.
+    """
+    body = doc.element.body
+    style_names = _docx_style_names(doc)
+    use_rendered = body.find('.//' + qn('w:lastRenderedPageBreak')) is not None
+    page_sections = set() if use_rendered else _docx_page_sections(body)
+
+    page = 1
+    section = ""
+    page_text = []
+    page_section = ""
+    stats['total_pages'] = 1
+    stats['total_tables'] = 0
+
+    def flush():
+        chunks = create_smart_chunks(
+            "\n\n".join(page_text),
+            chunk_size=1500,
+            overlap=250,
+            page_num=page,
+            source_file=filename
+        )
+        for chunk in chunks:
+            chunk['metadata']['section'] = page_section or "N/A"
+        page_text.clear()
+        return chunks
+
+    for element in body.iterchildren():
+        if element.tag == qn('w:p'):
+            breaks = _docx_page_breaks(element, use_rendered, page_sections)
+            if breaks and use_rendered:
+                # Rendered markers sit where the new page starts.
+                yield from flush()
+                page += breaks
+
+            text = clean_text(Paragraph(element, doc).text)
+            if text and _docx_heading(element, style_names):
+                section = text
+            if text:
+                structured = structure_text_into_paragraphs(text)
+                if structured:
+                    if not page_text:
+                        page_section = section
+                    page_text.append(structured)
+
+            if breaks and not use_rendered:
+                yield from flush()
+                page += breaks
+
+        elif element.tag == qn('w:tbl'):
+            table = Table(element, doc)
+            stats['total_tables'] += 1
+            table_text = format_table_as_structured_text(
+                [[cell.text for cell in row.cells] for row in table.rows],
+                stats['total_tables']
+            )
+            if table_text:
+                if not page_text:
+                    page_section = section
+                page_text.append(table_text)
+                table_chunks = create_smart_chunks(
+                    table_text,
+                    chunk_size=2000,
+                    overlap=0,
+                    page_num=page,
+                    source_file=filename,
+                    is_table=True,
+                    table_num=stats['total_tables']
+                )
+                for chunk in table_chunks:
+                    chunk['metadata']['section'] = section or "N/A"
+                yield from table_chunks
+
+        stats['total_pages'] = page
+
+    yield from flush()
+
 def extract_docx_detailed(filepath):
-    doc = docx.Document(filepath)
+    try:
+        doc = docx.Document(filepath)
+    except Exception as e:
+        return None, f"❌ DOCX open error: {str(e)}"
     filename = os.path.basename(filepath)
+    stats = {}
+    chunks = list(iter_docx_chunks(doc, filename, stats))
+    pages_with_tables = sorted({
+        int(c['metadata']['page']) for c in chunks if c['metadata']['is_table'] == "True"
+    })
     file_info = {
-        'chunks': [],
-        'total_pages': 1,
-        'total_tables': 0,
-        'pages_with_tables': [],
+        'chunks': chunks,
+        'total_pages': stats['total_pages'],
+        'total_tables': stats['total_tables'],
+        'pages_with_tables': pages_with_tables,
     }
-   
-    all_text = []
-    table_counter = 0
-   
-    for element in doc.element.body:
-        if element.tag.endswith('p'):
-            for para in doc.paragraphs:
-                if para._element == element:
-                    text = clean_text(para.text)
-                    if text:
-                        structured = structure_text_into_paragraphs(text)
-                        if structured:
-                            all_text.append(structured)
-                    break
-       
-        elif element.tag.endswith('tbl'):
-            for table in doc.tables:
-                if table._element == element:
-                    file_info['total_tables'] += 1
-                    table_counter += 1
-                    table_text = format_table_as_structured_text(
-                        [[cell.text for cell in row.cells] for row in table.rows],
-                        table_counter
-                    )
-                    if table_text:
-                        all_text.append(table_text)
-                        table_chunks = create_smart_chunks(
-                            table_text,
-                            chunk_size=2000,
-                            overlap=0,
-                            page_num=1,
-                            source_file=filename,
-                            is_table=True,
-                            table_num=table_counter
-                        )
-                        file_info['chunks'].extend(table_chunks)
-                    break
-   
-    complete_text = "\n\n".join(all_text)
-    text_chunks = create_smart_chunks(
-        complete_text, 
-        chunk_size=1500, 
-        overlap=250,
-        page_num=1,
-        source_file=filename
-    )
-    file_info['chunks'].extend(text_chunks)
-   
-    if file_info['total_tables'] > 0:
-        file_info['pages_with_tables'] = [1]
-   
     return file_info, None
 
 def extract_txt_detailed(filepath):
@@ -281,7 +643,93 @@ def extract_txt_detailed(filepath):
     }
     return file_info, None
     
-def get_files_from_folder():
-    return glob.glob(os.path.join(DOCS_FOLDER, "*.[pP][dD][fF]")) + \
-           glob.glob(os.path.join(DOCS_FOLDER, "*.[dD][oO][cC][xX]")) + \
-           glob.glob(os.path.join(DOCS_FOLDER, "*.txt"))
+def extract_file(filepath, file_hash=None, workers=None):
+    """Returns `(info, error, from_cache)`; a file that fails to extract comes back as an error, like collect_pdf."""
+    name = os.path.basename(filepath)
+    ext = name.split(".")[-1].lower()
+    try:
+        key = make_cache_key(file_hash or get_file_hash(filepath), ext)
+        cached = load_cache(key, with_embeddings=True)
+        if cached:
+            return cached, None, True
+
+        if ext == "pdf":
+            info, error = extract_pdf_detailed(filepath, workers)
+        elif ext in ["doc", "docx"]:
+            info, error = extract_docx_detailed(filepath)
+        elif ext == "txt":
+            info, error = extract_txt_detailed(filepath)
+        else:
+            return None, f"Unsupported file type: {ext}", False
+        if error:
+            return None, error, False
+
+        save_cache(key, info)
+    except Exception as e:
+        return None, f"❌ Extraction error: {str(e)}", False
+    return info, None, False
+
+def iter_extract_files(files, workers=None, window=None):
+    """Yield `(filepath, info, error, from_cache)` for `(filepath, file_hash)` pairs, in input order.
+
+    With more than one worker, up to `window` files (EXTRACT_WINDOW by
+    default) have their PDF pages queued on one shared process pool at a
+    time, so extraction of the next files overlaps whatever the consumer
+    does with the current one without holding the whole corpus in memory.
+    """
+    workers = workers or PDF_WORKERS
+    if workers <= 1:
+        for path, file_hash in files:
+            yield (path,) + extract_file(path, file_hash, 1)
+        return
+
+    window = window or EXTRACT_WINDOW
+    with _process_pool(workers) as pool:
+        in_flight = deque()
+        remaining = iter(files)
+
+        def top_up():
+            while len(in_flight) < window:
+                item = next(remaining, None)
+                if item is None:
+                    return
+                path, file_hash = item
+                ext = path.split(".")[-1].lower()
+                key = make_cache_key(file_hash, ext)
+                cached = load_cache(key, with_embeddings=True)
+                if cached:
+                    in_flight.append((path, file_hash, key, None, (cached, None, True)))
+                elif ext == "pdf":
+                    job, error = submit_pdf(pool, path)
+                    in_flight.append((path, file_hash, key, job, None if job else (None, error, False)))
+                else:
+                    in_flight.append((path, file_hash, key, None, None))
+
+        top_up()
+        while in_flight:
+            path, file_hash, key, job, result = in_flight.popleft()
+            top_up()
+            if result is None and job is not None:
+                info, error = collect_pdf(path, job)
+                if not error:
+                    save_cache(key, info)
+                result = (info, error, False)
+            elif result is None:
+                result = extract_file(path, file_hash, 1)
+            yield (path,) + result
+
+def extract_files(files, workers=None):
+    """Extract `(filepath, file_hash)` pairs, returning `(info, error, from_cache)` in input order.
+
+    With more than one worker, all uncached PDFs share one process pool.
+    """
+    return [
+        result[1:]
+        for result in iter_extract_files(files, workers, window=max(len(files), 1))
+    ]
+
+def get_files_from_folder(folder=None):
+    folder = folder or DOCS_FOLDER
+    return glob.glob(os.path.join(folder, "*.[pP][dD][fF]")) + \
+           glob.glob(os.path.join(folder, "*.[dD][oO][cC][xX]")) + \
+           glob.glob(os.path.join(folder, "*.txt"))
@@ -0,0 +1,154 @@
+import os
+import re
+import json
+import hashlib
+import threading
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+def content_key(text, model):
+    return hashlib.sha256(f"{model}\x1f{text}".encode("utf-8")).hexdigest()[:32]
+
+
+@contextmanager
+def _locked(path):
+    """Hold an exclusive lock on `path` that other processes honour too."""
+    with open(path, "a+b") as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+class EmbeddingStore:
+    """Content-addressed float16 embedding store for one model.
+
+    Vectors are appended to a flat `vectors.f16` file that is read through
+    np.memmap. `index.json` holds the vector size and `keys.log` gets one
+    "key row" line per stored vector, so a write only appends to both files.
+    Writers hold `store.lock`, so ingest.py and the service can share a store.
+    """
+
+    def __init__(self, folder, model):
+        self.model = model
+        self.folder = os.path.join(folder, re.sub(r"[^\w.-]+", "_", model))
+        self.vectors_file = os.path.join(self.folder, "vectors.f16")
+        self.index_file = os.path.join(self.folder, "index.json")
+        self.log_file = os.path.join(self.folder, "keys.log")
+        self.lock_file = os.path.join(self.folder, "store.lock")
+        self._lock = threading.Lock()
+        self._mmap = None
+        self._log_offset = 0
+        self.dim = None
+        self.rows = {}
+        os.makedirs(self.folder, exist_ok=True)
+        self._load_dim()
+        if self.dim:
+            self._read_log()
+        if self.dim and os.path.exists(self.vectors_file):
+            # Drop rows that point past the end of a truncated vectors file.
+            stored = os.path.getsize(self.vectors_file) // (2 * self.dim)
+            self.rows = {k: r for k, r in self.rows.items() if r < stored}
+
+    def _load_dim(self):
+        if os.path.exists(self.index_file):
+            try:
+                with open(self.index_file, "r", encoding="utf-8") as f:
+                    self.dim = json.load(f)["dim"]
+            except Exception:
+                self.dim = None
+
+    def _read_log(self):
+        """Add the keys appended to keys.log since the last read; returns whether its tail is torn.
+
+        An unterminated last line is another writer's append in progress, or
+        one a crash cut short; it is left for the next read.
+        """
+        if not os.path.exists(self.log_file):
+            return False
+        with open(self.log_file, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        complete = data.rfind(b"\n") + 1
+        for line in data[:complete].decode("utf-8", "replace").splitlines():
+            parts = line.split()
+            if len(parts) == 2 and parts[1].isdigit():
+                self.rows[parts[0]] = int(parts[1])
+        self._log_offset += complete
+        return complete < len(data)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def key(self, text):
+        return content_key(text, self.model)
+
+    def _matrix(self):
+        if self._mmap is None and self.rows:
+            self._mmap = np.memmap(self.vectors_file, dtype=np.float16, mode="r").reshape(-1, self.dim)
+        return self._mmap
+
+    def get_many(self, keys):
+        """Return one float32 vector (or None when unknown) per key."""
+        with self._lock:
+            matrix = self._matrix()
+            return [
+                np.asarray(matrix[self.rows[k]], dtype=np.float32) if k in self.rows else None
+                for k in keys
+            ]
+
+    def put_many(self, keys, vectors):
+        with self._lock:
+            if all(k in self.rows for k in keys):
+                return
+            with _locked(self.lock_file):
+                # Another process may have written since this store was loaded:
+                # pick up its keys and append after its rows, never over them.
+                if self.dim is None:
+                    self._load_dim()
+                torn = self.dim is not None and self._read_log()
+                self._mmap = None
+                fresh = list({k: v for k, v in zip(keys, vectors) if k not in self.rows}.items())
+                if not fresh:
+                    return
+                block = np.asarray([v for _, v in fresh], dtype=np.float16)
+                if self.dim is None:
+                    self.dim = block.shape[1]
+                    tmp_file = self.index_file + ".tmp"
+                    with open(tmp_file, "w", encoding="utf-8") as f:
+                        json.dump({"dim": self.dim}, f)
+                    os.replace(tmp_file, self.index_file)
+                row_bytes = 2 * self.dim
+                stored = os.path.getsize(self.vectors_file) if os.path.exists(self.vectors_file) else 0
+                start = stored // row_bytes
+                with open(self.vectors_file, "r+b" if stored else "wb") as f:
+                    # Only a partial row left by a crashed writer is cut off.
+                    f.truncate(start * row_bytes)
+                    f.seek(start * row_bytes)
+                    f.write(block.tobytes())
+                lines = "".join(f"{k} {start + offset}\n" for offset, (k, _) in enumerate(fresh))
+                with open(self.log_file, "ab") as f:
+                    if torn:
+                        # Under the lock a torn line can only come from a crashed writer.
+                        f.truncate(self._log_offset)
+                    f.write(lines.encode("utf-8"))
+                    self._log_offset = f.tell()
+                for offset, (k, _) in enumerate(fresh):
+                    self.rows[k] = start + offset
@@ -0,0 +1,80 @@
+import os
+import time
+import threading
+
+import numpy as np
+from chromadb.utils.embedding_functions import SentenceTransformerEmbeddingFunction
+
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "intfloat/multilingual-e5-large")
+EMBEDDING_DEVICE = os.getenv("EMBEDDING_DEVICE", "cpu")
+
+_model = None
+_model_lock = threading.Lock()
+_embedding_function = None
+_stats = {"loaded": False, "load_seconds": None, "rss_mb_before": None, "rss_mb_after": None}
+
+
+def get_rss_mb():
+    try:
+        with open("/proc/self/status", "r") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    try:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return None
+
+
+def get_embedding_model():
+    """Process-wide SentenceTransformer, loaded on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import SentenceTransformer
+
+                _stats["rss_mb_before"] = get_rss_mb()
+                start = time.perf_counter()
+                model = SentenceTransformer(EMBEDDING_MODEL, device=EMBEDDING_DEVICE)
+                _stats["load_seconds"] = time.perf_counter() - start
+                _stats["rss_mb_after"] = get_rss_mb()
+                _stats["loaded"] = True
+                _model = model
+    return _model
+
+
+def get_embedding_stats():
+    return dict(_stats, model=EMBEDDING_MODEL)
+
+
+class LazySentenceTransformerEmbeddingFunction(SentenceTransformerEmbeddingFunction):
+    """Chroma embedding function that defers model loading to the first embed call.
+
+    Keeps the sentence_transformer name and config, so collections created with
+    the stock embedding function open unchanged.
+    """
+
+    def __init__(self):
+        self.model_name = EMBEDDING_MODEL
+        self.device = EMBEDDING_DEVICE
+        self.normalize_embeddings = False
+        self.kwargs = {}
+
+    def __call__(self, input):
+        embeddings = get_embedding_model().encode(
+            list(input),
+            convert_to_numpy=True,
+            normalize_embeddings=self.normalize_embeddings,
+        )
+        return [np.array(embedding, dtype=np.float32) for embedding in embeddings]
+
+
+def get_embedding_function():
+    global _embedding_function
+    if _embedding_function is None:
+        _embedding_function = LazySentenceTransformerEmbeddingFunction()
+    return _embedding_function
@@ -0,0 +1,464 @@
+import os
+import json
+import queue
+import hashlib
+import threading
+
+import numpy as np
+
+from DocumentProcessor import (
+    get_file_hash,
+    iter_extract_files,
+    detect_doc_language,
+    make_cache_key,
+    save_cache_embeddings
+)
+from LexicalIndex import BM25Index
+from Embeddings import EMBEDDING_MODEL, get_embedding_function
+from EmbeddingStore import EmbeddingStore
+
+CHROMA_FOLDER = os.getenv("CHROMA_FOLDER", "./chroma_db")
+COLLECTION_NAME = "biomed_docs"
+MANIFEST_FILE = os.path.join(CHROMA_FOLDER, "manifest.json")
+CATALOG_FILE = os.path.join(CHROMA_FOLDER, "catalog.json")
+LEXICAL_INDEX_FILE = os.path.join(CHROMA_FOLDER, "bm25.json")
+EMBEDDING_STORE_FOLDER = os.path.join(os.getenv("CACHE_FOLDER", "./cache"), "embeddings")
+ADD_BATCH_SIZE = 300
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "64"))
+# Documents waiting between extraction and embedding, and chunk batches
+# waiting between embedding and the Chroma upsert.
+INGEST_QUEUE_SIZE = int(os.getenv("INGEST_QUEUE_SIZE", "2"))
+UPSERT_QUEUE_SIZE = int(os.getenv("UPSERT_QUEUE_SIZE", "4"))
+
+os.makedirs(CHROMA_FOLDER, exist_ok=True)
+
+_catalog = None
+_catalog_mtime = None
+_lexical_index = None
+_embedding_store = None
+_DONE = object()
+
+
+def _noop(level, message):
+    pass
+
+
+def load_manifest():
+    """The sync manifest, or None when there is none yet.
+
+    An unreadable manifest raises instead of returning None: open_collection
+    treats a missing manifest as a legacy index and wipes it.
+    """
+    if not os.path.exists(MANIFEST_FILE):
+        return None
+    try:
+        with open(MANIFEST_FILE, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError) as e:
+        raise RuntimeError(
+            f"Cannot read {MANIFEST_FILE} ({e}); fix or remove it, or rebuild with `python ingest.py --reset`"
+        ) from e
+
+
+def save_manifest(manifest):
+    tmp_file = MANIFEST_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, MANIFEST_FILE)
+
+
+def build_catalog(manifest):
+    sources = {}
+    for name, entry in sorted(manifest.get("files", {}).items()):
+        sources[name] = {
+            "lang": entry.get("lang") or detect_doc_language(name),
+            "chunks": entry["chunks"],
+            "tables": entry.get("tables", 0),
+            "pages": entry.get("pages", 0),
+        }
+    version = hashlib.sha256(json.dumps(
+        sorted((name, entry["hash"]) for name, entry in manifest.get("files", {}).items())
+    ).encode("utf-8")).hexdigest()[:16]
+    return {
+        "version": version,
+        "languages": sorted({s["lang"] for s in sources.values() if s["chunks"]}),
+        "sources": sources,
+        "total_chunks": sum(s["chunks"] for s in sources.values()),
+        "total_tables": sum(s["tables"] for s in sources.values()),
+    }
+
+
+def _mtime(path):
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def save_catalog(catalog):
+    global _catalog, _catalog_mtime
+    tmp_file = CATALOG_FILE + ".tmp"
+    with open(tmp_file, "w", encoding="utf-8") as f:
+        json.dump(catalog, f, indent=2, sort_keys=True)
+    os.replace(tmp_file, CATALOG_FILE)
+    _catalog = catalog
+    _catalog_mtime = _mtime(CATALOG_FILE)
+
+
+def get_catalog():
+    """Corpus catalog written at sync time; reloaded when another process (e.g. ingest.py) rewrites it."""
+    global _catalog, _catalog_mtime
+    mtime = _mtime(CATALOG_FILE)
+    if mtime != _catalog_mtime:
+        _catalog_mtime = mtime
+        try:
+            with open(CATALOG_FILE, "r", encoding="utf-8") as f:
+                _catalog = json.load(f)
+        except Exception:
+            _catalog = None
+    return _catalog
+
+
+def get_lexical_index():
+    """BM25 index over the collection's chunk IDs; reloaded when another process rewrites bm25.json."""
+    global _lexical_index
+    if _lexical_index is None:
+        index = BM25Index(LEXICAL_INDEX_FILE)
+        index.load()
+        _lexical_index = index
+    else:
+        _lexical_index.reload_if_changed()
+    return _lexical_index
+
+
+def rebuild_lexical_index(collection):
+    index = get_lexical_index()
+    index.clear()
+    total = collection.count()
+    for offset in range(0, total, ADD_BATCH_SIZE):
+        batch = collection.get(include=["documents", "metadatas"], limit=ADD_BATCH_SIZE, offset=offset)
+        index.add(
+            batch["ids"],
+            batch["documents"],
+            [(m or {}).get("source", "Unknown") for m in batch["metadatas"]]
+        )
+    index.save()
+
+
+def make_doc_id(source, file_hash):
+    return hashlib.md5(f"{source}:{file_hash}".encode("utf-8")).hexdigest()[:16]
+
+
+def make_chunk_id(doc_id, n):
+    return f"{doc_id}_{n:05d}"
+
+
+def open_collection(client, embedding_function):
+    """Open the document collection, dropping legacy indexes built without a manifest."""
+    global _catalog
+    manifest = load_manifest()
+    names = [c.name if hasattr(c, "name") else c for c in client.list_collections()]
+
+    if manifest is None and names:
+        for name in names:
+            client.delete_collection(name)
+
+    if manifest is None:
+        if os.path.exists(CATALOG_FILE):
+            os.remove(CATALOG_FILE)
+        _catalog = None
+        get_lexical_index().clear()
+        get_lexical_index().save()
+        manifest = {"files": {}}
+        save_manifest(manifest)
+
+    collection = client.get_or_create_collection(
+        name=COLLECTION_NAME,
+        embedding_function=embedding_function,
+        metadata={"hnsw:space": "cosine"}
+    )
+
+    if not os.path.exists(LEXICAL_INDEX_FILE) and collection.count():
+        rebuild_lexical_index(collection)
+
+    return collection, manifest
+
+
+def open_prebuilt_collection(client, embedding_function):
+    """Open an existing index read-only; returns (collection, manifest), or (None, None) when none exists."""
+    names = [c.name if hasattr(c, "name") else c for c in client.list_collections()]
+    if not names:
+        return None, None
+    name = COLLECTION_NAME if COLLECTION_NAME in names else names[0]
+    collection = client.get_collection(name=name, embedding_function=embedding_function)
+    return collection, load_manifest()
+
+
+def plan_sync(files, manifest):
+    current = {}
+    for path in files:
+        current[os.path.basename(path)] = (path, get_file_hash(path))
+
+    known = manifest.get("files", {})
+    added, changed, unchanged = [], [], []
+    for name, (path, file_hash) in sorted(current.items()):
+        if name not in known:
+            added.append((name, path, file_hash))
+        elif known[name]["hash"] != file_hash:
+            changed.append((name, path, file_hash))
+        else:
+            unchanged.append(name)
+
+    removed = sorted(name for name in known if name not in current)
+    return {"added": added, "changed": changed, "removed": removed, "unchanged": unchanged}
+
+
+def _remove_document(collection, name, entry):
+    ids = [make_chunk_id(entry["doc_id"], n) for n in range(entry["chunks"])]
+    for i in range(0, len(ids), ADD_BATCH_SIZE):
+        collection.delete(ids=ids[i:i + ADD_BATCH_SIZE])
+    # Catch chunks that were written before the manifest entry was saved.
+    collection.delete(where={"source": name})
+    get_lexical_index().remove_source(name)
+
+
+def get_embedding_store():
+    global _embedding_store
+    if _embedding_store is None:
+        _embedding_store = EmbeddingStore(EMBEDDING_STORE_FOLDER, EMBEDDING_MODEL)
+    return _embedding_store
+
+
+def cached_embeddings(info):
+    """Embeddings stored with the document's extraction cache, if they match the model."""
+    cached = info.get("embeddings")
+    if cached is not None and info.get("embedding_model") == EMBEDDING_MODEL and len(cached) == len(info["chunks"]):
+        return cached
+    return None
+
+
+def embed_texts(texts, stats=None):
+    """Embed chunk texts; only texts unseen by the model are encoded.
+
+    Consults the content-addressed embedding store first. `stats` counts
+    "reused" and "encoded" chunks.
+    """
+    stats = stats if stats is not None else {}
+    stats.setdefault("reused", 0)
+    stats.setdefault("encoded", 0)
+    store = get_embedding_store()
+    keys = [store.key(t) for t in texts]
+    embeddings = store.get_many(keys)
+    missing = [i for i, e in enumerate(embeddings) if e is None]
+    stats["reused"] += len(texts) - len(missing)
+    stats["encoded"] += len(missing)
+
+    if missing:
+        encoded = get_embedding_function()([texts[i] for i in missing])
+        store.put_many([keys[i] for i in missing], encoded)
+        for i, embedding in zip(missing, encoded):
+            embeddings[i] = np.asarray(embedding, dtype=np.float32)
+    return embeddings
+
+
+def _put(q, item, stop):
+    # Blocks while the queue is full (backpressure) but gives up once the pipeline stops.
+    while not stop.is_set():
+        try:
+            q.put(item, timeout=0.5)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _get(q, stop):
+    while not stop.is_set():
+        try:
+            return q.get(timeout=0.5)
+        except queue.Empty:
+            continue
+    return _DONE
+
+
+def _start_stage(target, out_queue, stop, *args):
+    def run():
+        try:
+            target(out_queue, stop, *args)
+        except Exception as e:
+            _put(out_queue, ("fatal", e), stop)
+        finally:
+            _put(out_queue, _DONE, stop)
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread
+
+
+def _extract_stage(out_queue, stop, todo, workers):
+    files = [(path, file_hash) for _, (_, path, file_hash) in todo]
+    for (kind, (name, _, file_hash)), (_, info, error, from_cache) in zip(todo, iter_extract_files(files, workers)):
+        if not _put(out_queue, (kind, name, file_hash, info, error, from_cache), stop):
+            return
+
+
+def _embed_stage(out_queue, stop, in_queue, stats):
+    while True:
+        item = _get(in_queue, stop)
+        if item is _DONE:
+            return
+        if item[0] == "fatal":
+            _put(out_queue, item, stop)
+            continue
+
+        kind, name, file_hash, info, error, from_cache = item
+        if error:
+            _put(out_queue, ("error", name, error), stop)
+            continue
+
+        chunks = info["chunks"]
+        doc_id = make_doc_id(name, file_hash)
+        cached = cached_embeddings(info)
+        doc_embeddings = []
+        _put(out_queue, ("start", name), stop)
+
+        for i in range(0, len(chunks), EMBED_BATCH_SIZE):
+            batch = chunks[i:i + EMBED_BATCH_SIZE]
+            if cached is not None:
+                embeddings = [np.asarray(e, dtype=np.float32) for e in cached[i:i + EMBED_BATCH_SIZE]]
+                stats["reused"] += len(batch)
+            else:
+                embeddings = embed_texts([c["content"] for c in batch], stats)
+                doc_embeddings.extend(embeddings)
+            ids = [make_chunk_id(doc_id, n) for n in range(i, i + len(batch))]
+            if not _put(out_queue, ("batch", name, ids, batch, embeddings), stop):
+                return
+
+        if doc_embeddings:
+            ext = name.split(".")[-1].lower()
+            save_cache_embeddings(make_cache_key(file_hash, ext), doc_embeddings, EMBEDDING_MODEL)
+
+        entry = {
+            "hash": file_hash,
+            "doc_id": doc_id,
+            "lang": detect_doc_language(name),
+            "chunks": len(chunks),
+            "tables": info.get("total_tables", 0),
+            "pages": info.get("total_pages", 0),
+        }
+        _put(out_queue, ("end", kind, name, entry, from_cache), stop)
+
+
+def sync_collection(collection, manifest, files, progress=_noop, workers=None):
+    """Bring the collection in line with `files`, touching only added, changed or removed documents.
+
+    Runs as a streaming pipeline: extraction -> batched embedding -> batched
+    upsert, with bounded queues between the stages, so extraction of the next
+    file overlaps embedding of the current one and memory stays flat as the
+    corpus grows. Collection writes and `progress(level, message)` calls
+    (level "info", "success" or "warning") happen on the calling thread.
+    `workers` sets the extraction process pool size (defaults to PDF_WORKERS).
+    """
+    plan = plan_sync(files, manifest)
+    known = manifest.setdefault("files", {})
+    summary = {
+        "added": [],
+        "changed": [],
+        "removed": [],
+        "unchanged": plan["unchanged"],
+        "failed": [],
+        "chunks_written": 0,
+        "embeddings": {"reused": 0, "encoded": 0},
+    }
+
+    lexical = get_lexical_index()
+    if manifest.pop("lexical_pending", False):
+        # The previous sync stopped before saving bm25.json.
+        progress("info", "🔁 Rebuilding the keyword index after an interrupted sync")
+        rebuild_lexical_index(collection)
+        save_manifest(manifest)
+
+    todo = [(kind, item) for kind in ("added", "changed") for item in plan[kind]]
+    if plan["removed"] or todo:
+        # bm25.json is written once at the end; this flag marks it stale until then.
+        manifest["lexical_pending"] = True
+        save_manifest(manifest)
+
+    for name in plan["removed"]:
+        _remove_document(collection, name, known.pop(name))
+        save_manifest(manifest)
+        summary["removed"].append(name)
+        progress("info", f"🗑️ Removed from index: {name}")
+
+    stop = threading.Event()
+    extracted = queue.Queue(maxsize=INGEST_QUEUE_SIZE)
+    embedded = queue.Queue(maxsize=UPSERT_QUEUE_SIZE)
+    stages = [
+        _start_stage(_extract_stage, extracted, stop, todo, workers),
+        _start_stage(_embed_stage, embedded, stop, extracted, summary["embeddings"]),
+    ]
+
+    try:
+        while True:
+            item = embedded.get()
+            if item is _DONE:
+                break
+
+            if item[0] == "fatal":
+                raise item[1]
+
+            elif item[0] == "error":
+                _, name, error = item
+                summary["failed"].append(name)
+                progress("warning", f"⚠️ Error in {name}: {error}")
+
+            elif item[0] == "start":
+                name = item[1]
+                if name in known:
+                    _remove_document(collection, name, known.pop(name))
+                    save_manifest(manifest)
+                else:
+                    collection.delete(where={"source": name})
+                    lexical.remove_source(name)
+
+            elif item[0] == "batch":
+                _, name, ids, batch, embeddings = item
+                collection.upsert(
+                    documents=[c["content"] for c in batch],
+                    metadatas=[c["metadata"] for c in batch],
+                    embeddings=embeddings,
+                    ids=ids
+                )
+                lexical.add(ids, [c["content"] for c in batch], [name] * len(batch))
+
+            elif item[0] == "end":
+                _, kind, name, entry, from_cache = item
+                known[name] = entry
+                save_manifest(manifest)
+                summary[kind].append(name)
+                summary["chunks_written"] += entry["chunks"]
+                if from_cache:
+                    progress("success", f"✅ Loaded from cache: {name}")
+                else:
+                    progress("success", f"✅ Processed successfully: {name}")
+    finally:
+        stop.set()
+        for stage in stages:
+            stage.join(timeout=1)
+
+    if manifest.pop("lexical_pending", False):
+        lexical.save()
+        save_manifest(manifest)
+
+    if summary["chunks_written"]:
+        progress(
+            "info",
+            f"♻️ Embeddings: {summary['embeddings']['reused']} reused, "
+            f"{summary['embeddings']['encoded']} encoded"
+        )
+    # Compared by version so a catalog left stale by an aborted sync is rebuilt too.
+    catalog = build_catalog(manifest)
+    if catalog["version"] != (get_catalog() or {}).get("version"):
+        save_catalog(catalog)
+
+    return summary
@@ -0,0 +1,368 @@
+import os
+import re
+import time
+import heapq
+import random
+import itertools
+import threading
+from collections import deque, defaultdict
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+from Tracing import annotate_span, percentile
+
+load_dotenv()
+
+GROQ_API_KEY = os.getenv("GROQ_API_KEY")
+GROQ_BASE_URL = os.getenv("GROQ_BASE_URL", "https://api.groq.com/openai/v1").rstrip("/")
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", "10"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "8"))
+LLM_RATE_LIMIT_RPM = float(os.getenv("LLM_RATE_LIMIT_RPM", "30"))
+LLM_RATE_LIMIT_TPM = float(os.getenv("LLM_RATE_LIMIT_TPM", "12000"))
+LLM_MAX_QUEUE_WAIT = float(os.getenv("LLM_MAX_QUEUE_WAIT", "30"))
+
+RETRY_STATUSES = {500, 502, 503, 504}
+LATENCY_WINDOW = 200
+
+# Lower runs first: answers are what a user is waiting on, translations only widen recall.
+KIND_PRIORITY = {"answer": 0, "answer_stream": 0, "translate": 1}
+DEFAULT_PRIORITY = 1
+DURATION_PATTERN = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+
+_session = None
+_session_lock = threading.Lock()
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_session():
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=LLM_POOL_SIZE, pool_maxsize=LLM_POOL_SIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                session.headers.update({
+                    "Authorization": f"Bearer {GROQ_API_KEY}",
+                    "Content-Type": "application/json"
+                })
+                _session = session
+    return _session
+
+
+class RateLimitExceeded(Exception):
+    """Raised when a call would have to queue longer than its max_wait."""
+
+    def __init__(self, wait_seconds):
+        super().__init__(f"Groq rate limit: next slot in {wait_seconds:.0f}s")
+        self.wait_seconds = wait_seconds
+
+
+def parse_duration(value):
+    """Parse Groq reset headers such as "2m59.56s", "7.66s" or "250ms" into seconds."""
+    if not value:
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        pass
+    units = {"h": 3600.0, "m": 60.0, "s": 1.0, "ms": 0.001}
+    parts = DURATION_PATTERN.findall(value)
+    return sum(float(n) * units[unit] for n, unit in parts) if parts else None
+
+
+def estimate_payload_tokens(payload):
+    """Prompt characters / 4 plus the completion allowance, as charged against the TPM quota."""
+    chars = sum(len(m.get("content") or "") for m in payload.get("messages", []))
+    return chars // 4 + int(payload.get("max_tokens") or 1024)
+
+
+class _Bucket:
+    def __init__(self, capacity, per_minute):
+        self.capacity = capacity
+        self.rate = per_minute / 60.0
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, cost):
+        missing = min(cost, self.capacity) - self.level
+        return max(0.0, missing / self.rate) if self.rate > 0 else 0.0
+
+    def sync(self, limit, remaining, reset_seconds, now):
+        self.refill(now)
+        if limit:
+            self.capacity = limit
+        if remaining is not None:
+            self.level = min(self.capacity, remaining)
+            if reset_seconds and remaining < self.capacity:
+                # The server refills the bucket to its limit within reset_seconds.
+                self.rate = (self.capacity - remaining) / reset_seconds
+
+
+class RateLimitScheduler:
+    """Process-wide token bucket for Groq request and token quotas.
+
+    Requests are paced at LLM_RATE_LIMIT_RPM and tokens at LLM_RATE_LIMIT_TPM.
+    Groq's x-ratelimit-*-tokens headers are per minute and re-sync the token
+    bucket; its x-ratelimit-*-requests headers are per day (RPD), so they only
+    hold calls once the daily quota is used up. Waiting calls are ordered by
+    priority (answers before translations) and, within a priority, by
+    start-time fair queueing across sessions, so one busy session cannot
+    starve the others.
+    """
+
+    def __init__(self, requests_per_minute, tokens_per_minute):
+        self._cond = threading.Condition()
+        self._requests = _Bucket(requests_per_minute, requests_per_minute)
+        self._tokens = _Bucket(tokens_per_minute, tokens_per_minute)
+        self._blocked_until = 0.0
+        self._daily_remaining = None
+        self._daily_reset_at = 0.0
+        self._queue = []
+        self._seq = itertools.count()
+        self._session_turns = defaultdict(int)
+        self._virtual_turn = 0
+        self._waits = {}
+        self._rejected = defaultdict(int)
+
+    def _daily_wait(self, now):
+        if self._daily_remaining is None or self._daily_remaining >= 1:
+            return 0.0
+        if now >= self._daily_reset_at:
+            # The daily window has rolled over; the next response reports the new count.
+            self._daily_remaining = None
+            return 0.0
+        return self._daily_reset_at - now
+
+    def _wait_time(self, cost, now):
+        self._requests.refill(now)
+        self._tokens.refill(now)
+        return max(
+            self._blocked_until - now,
+            self._daily_wait(now),
+            self._requests.wait_time(1),
+            self._tokens.wait_time(cost),
+            0.0
+        )
+
+    def _leave(self, ticket):
+        self._queue.remove(ticket)
+        heapq.heapify(self._queue)
+        self._cond.notify_all()
+
+    def acquire(self, cost, priority=DEFAULT_PRIORITY, session=None, max_wait=None, kind="chat"):
+        """Block until one request and `cost` tokens are available; returns seconds waited.
+
+        Raises RateLimitExceeded if the slot is not expected within `max_wait`.
+        """
+        start = time.monotonic()
+        deadline = start + max_wait if max_wait is not None else float("inf")
+        with self._cond:
+            turn = max(self._session_turns[session], self._virtual_turn)
+            self._session_turns[session] = turn + 1
+            ticket = (priority, turn, next(self._seq), kind)
+            heapq.heappush(self._queue, ticket)
+
+            while True:
+                now = time.monotonic()
+                if self._queue[0] is ticket:
+                    wait = self._wait_time(cost, now)
+                    if wait <= 0:
+                        heapq.heappop(self._queue)
+                        self._requests.level -= 1
+                        self._tokens.level -= min(cost, self._tokens.capacity)
+                        if self._daily_remaining is not None:
+                            self._daily_remaining -= 1
+                        self._virtual_turn = turn
+                        self._cond.notify_all()
+                        waited = now - start
+                        self._waits.setdefault(kind, deque(maxlen=LATENCY_WINDOW)).append(waited)
+                        return waited
+                    if now + wait > deadline:
+                        self._leave(ticket)
+                        self._rejected[kind] += 1
+                        raise RateLimitExceeded(wait)
+                    self._cond.wait(wait)
+                else:
+                    if now >= deadline:
+                        self._leave(ticket)
+                        self._rejected[kind] += 1
+                        raise RateLimitExceeded(self._wait_time(cost, now))
+                    self._cond.wait(None if deadline == float("inf") else deadline - now)
+
+    def update(self, headers):
+        """Re-sync the token bucket and the daily request quota from x-ratelimit-* response headers."""
+        def number(name):
+            try:
+                return float(headers[name])
+            except (KeyError, TypeError, ValueError):
+                return None
+
+        now = time.monotonic()
+        with self._cond:
+            remaining = number("x-ratelimit-remaining-requests")
+            if remaining is not None:
+                self._daily_remaining = remaining
+                self._daily_reset_at = now + (parse_duration(headers.get("x-ratelimit-reset-requests")) or 0.0)
+            self._tokens.sync(
+                number("x-ratelimit-limit-tokens"),
+                number("x-ratelimit-remaining-tokens"),
+                parse_duration(headers.get("x-ratelimit-reset-tokens")),
+                now
+            )
+            self._cond.notify_all()
+
+    def block(self, seconds):
+        """Hold every call for `seconds`, e.g. after a 429 with Retry-After."""
+        with self._cond:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    def stats(self):
+        with self._cond:
+            now = time.monotonic()
+            self._requests.refill(now)
+            self._tokens.refill(now)
+            queued = defaultdict(int)
+            for ticket in self._queue:
+                queued[ticket[3]] += 1
+            return {
+                "queue_depth": len(self._queue),
+                "queued": dict(queued),
+                "blocked_for": max(0.0, self._blocked_until - now),
+                "requests_available": self._requests.level,
+                "requests_remaining_today": self._daily_remaining,
+                "tokens_available": self._tokens.level,
+                "wait": {
+                    kind: {
+                        "calls": len(waits),
+                        "p50": percentile(waits, 0.50),
+                        "p95": percentile(waits, 0.95),
+                        "max": max(waits) if waits else 0.0,
+                        "rejected": self._rejected[kind],
+                    }
+                    for kind, waits in self._waits.items()
+                },
+            }
+
+
+scheduler = RateLimitScheduler(LLM_RATE_LIMIT_RPM, LLM_RATE_LIMIT_TPM)
+
+
+def get_scheduler_stats():
+    """Queue depth, remaining quota and per-kind queue wait (seconds) of the shared scheduler."""
+    return scheduler.stats()
+
+
+def _backoff(attempt):
+    # Full jitter: sleep a random amount up to the exponential cap.
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * (2 ** attempt)))
+
+
+def _record(kind, elapsed, retries, ok):
+    with _stats_lock:
+        entry = _stats.setdefault(kind, {
+            "calls": 0,
+            "errors": 0,
+            "retries": 0,
+            "total_seconds": 0.0,
+            "max_seconds": 0.0,
+            "recent": deque(maxlen=LATENCY_WINDOW),
+        })
+        entry["calls"] += 1
+        entry["retries"] += retries
+        entry["total_seconds"] += elapsed
+        entry["max_seconds"] = max(entry["max_seconds"], elapsed)
+        entry["recent"].append(elapsed)
+        if not ok:
+            entry["errors"] += 1
+    annotate_span(retries=retries, llm_seconds=elapsed, llm_ok=ok)
+
+
+def get_latency_stats():
+    """Per-kind call counts and latencies in seconds (p50/p95 over the recent window)."""
+    with _stats_lock:
+        return {
+            kind: {
+                "calls": entry["calls"],
+                "errors": entry["errors"],
+                "retries": entry["retries"],
+                "mean": entry["total_seconds"] / entry["calls"] if entry["calls"] else 0.0,
+                "p50": percentile(entry["recent"], 0.50),
+                "p95": percentile(entry["recent"], 0.95),
+                "max": entry["max_seconds"],
+            }
+            for kind, entry in _stats.items()
+        }
+
+
+def chat_completion(payload, timeout=60, stream=False, kind="chat", session=None, max_wait=None):
+    """POST to /chat/completions on the shared session with bounded retries.
+
+    Every attempt first takes a slot from the shared rate-limit scheduler;
+    `session` identifies the caller for fair queueing and `max_wait` caps
+    the time spent queued (LLM_MAX_QUEUE_WAIT by default), after which
+    RateLimitExceeded is raised. Retries connection errors, timeouts, 5xx
+    responses and 429s (after holding the scheduler for Retry-After) with
+    jittered exponential backoff. Other HTTP errors are raised as
+    requests.HTTPError right away. Returns the response; for streaming
+    calls the body is left unread and the recorded latency is time to
+    response headers, excluding time spent queued.
+    """
+    session_http = get_session()
+    url = f"{GROQ_BASE_URL}/chat/completions"
+    cost = estimate_payload_tokens(payload)
+    priority = KIND_PRIORITY.get(kind, DEFAULT_PRIORITY)
+    max_wait = LLM_MAX_QUEUE_WAIT if max_wait is None else max_wait
+    start = time.perf_counter()
+    queued = 0.0
+    attempt = 0
+
+    while True:
+        try:
+            queued += scheduler.acquire(cost, priority, session, max(0.0, max_wait - queued), kind)
+        except RateLimitExceeded:
+            _record(kind, time.perf_counter() - start - queued, attempt, False)
+            raise
+        finally:
+            annotate_span(queued_seconds=queued)
+
+        try:
+            response = session_http.post(url, json=payload, timeout=timeout, stream=stream)
+            scheduler.update(response.headers)
+            if response.status_code == 429:
+                retry_after = parse_duration(response.headers.get("retry-after"))
+                scheduler.block(retry_after if retry_after is not None else 60)
+                if attempt < LLM_MAX_RETRIES:
+                    response.close()
+                    attempt += 1
+                    continue
+            if response.status_code in RETRY_STATUSES and attempt < LLM_MAX_RETRIES:
+                response.close()
+                time.sleep(_backoff(attempt))
+                attempt += 1
+                continue
+            response.raise_for_status()
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout):
+            if attempt < LLM_MAX_RETRIES:
+                time.sleep(_backoff(attempt))
+                attempt += 1
+                continue
+            _record(kind, time.perf_counter() - start - queued, attempt, False)
+            raise
+        except requests.exceptions.HTTPError:
+            _record(kind, time.perf_counter() - start - queued, attempt, False)
+            raise
+
+        _record(kind, time.perf_counter() - start - queued, attempt, True)
+        return response
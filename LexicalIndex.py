@@ -0,0 +1,122 @@
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter, defaultdict
+
+BM25_K1 = float(os.getenv("BM25_K1", "1.5"))
+BM25_B = float(os.getenv("BM25_B", "0.75"))
+
+# Keeps identifiers such as "WPM-12", "5.2" or "§3" together as single terms.
+TOKEN_PATTERN = re.compile(r"§?\w+(?:[-./]\w+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.casefold())
+
+
+class BM25Index:
+    """Inverted BM25 index over chunk IDs, persisted as JSON next to the Chroma store."""
+
+    def __init__(self, path):
+        self.path = path
+        self._docs = {}
+        self._postings = defaultdict(dict)
+        self._total_len = 0
+        self._mtime = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._docs)
+
+    def _index(self, chunk_id, source, tf):
+        length = sum(tf.values())
+        self._docs[chunk_id] = {"source": source, "len": length, "tf": tf}
+        self._total_len += length
+        for term, count in tf.items():
+            self._postings[term][chunk_id] = count
+
+    def _unindex(self, chunk_id):
+        doc = self._docs.pop(chunk_id, None)
+        if doc is None:
+            return
+        self._total_len -= doc["len"]
+        for term in doc["tf"]:
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+
+    def add(self, ids, texts, sources):
+        with self._lock:
+            for chunk_id, text, source in zip(ids, texts, sources):
+                self._unindex(chunk_id)
+                self._index(chunk_id, source, dict(Counter(tokenize(text))))
+
+    def remove_source(self, source):
+        with self._lock:
+            for chunk_id in [i for i, d in self._docs.items() if d["source"] == source]:
+                self._unindex(chunk_id)
+
+    def clear(self):
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_len = 0
+
+    def search(self, query, k=15):
+        """Return up to `k` (chunk_id, score) pairs, best first."""
+        with self._lock:
+            n = len(self._docs)
+            if not n:
+                return []
+            avg_len = self._total_len / n
+            scores = defaultdict(float)
+            for term in set(tokenize(query)):
+                postings = self._postings.get(term)
+                if not postings:
+                    continue
+                idf = math.log(1 + (n - len(postings) + 0.5) / (len(postings) + 0.5))
+                for chunk_id, tf in postings.items():
+                    length = self._docs[chunk_id]["len"]
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * length / avg_len)
+                    scores[chunk_id] += idf * tf * (BM25_K1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:k]
+
+    def save(self):
+        with self._lock:
+            data = {"docs": self._docs}
+            tmp_file = self.path + ".tmp"
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump(data, f)
+            os.replace(tmp_file, self.path)
+            self._mtime = os.stat(self.path).st_mtime_ns
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return False
+        try:
+            self._mtime = os.stat(self.path).st_mtime_ns
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return False
+        with self._lock:
+            self._docs.clear()
+            self._postings.clear()
+            self._total_len = 0
+            for chunk_id, doc in data.get("docs", {}).items():
+                self._index(chunk_id, doc["source"], doc["tf"])
+        return True
+
+    def reload_if_changed(self):
+        """Load the file again if another process (e.g. ingest.py) rewrote it since this index last saved or loaded it."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return False
+        if mtime == self._mtime:
+            return False
+        return self.load()
@@ -0,0 +1,93 @@
+import os
+import time
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+from Caches import LRUCache
+from Tracing import span
+
+RERANK_ENABLED = os.getenv("RERANK_ENABLED", "0") == "1"
+RERANK_MODEL = os.getenv("RERANK_MODEL", "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1")
+RERANK_MAX_CANDIDATES = int(os.getenv("RERANK_MAX_CANDIDATES", "30"))
+RERANK_TOP_K = int(os.getenv("RERANK_TOP_K", "6"))
+RERANK_TIMEOUT = float(os.getenv("RERANK_TIMEOUT", "1.5"))
+RERANK_BATCH_SIZE = int(os.getenv("RERANK_BATCH_SIZE", "32"))
+
+logger = logging.getLogger(__name__)
+
+score_cache = LRUCache(int(os.getenv("RERANK_CACHE_ITEMS", "20000")))
+
+_model = None
+_model_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+
+
+def get_rerank_model():
+    """Process-wide CrossEncoder on CPU, loaded on first use."""
+    global _model
+    if _model is None:
+        with _model_lock:
+            if _model is None:
+                from sentence_transformers import CrossEncoder
+
+                start = time.perf_counter()
+                _model = CrossEncoder(RERANK_MODEL, device="cpu")
+                logger.info("Loaded rerank model %s in %.1fs", RERANK_MODEL, time.perf_counter() - start)
+    return _model
+
+
+def _score_key(query, chunk_id):
+    return hashlib.sha256(f"{RERANK_MODEL}\x1f{query}\x1f{chunk_id}".encode("utf-8")).hexdigest()
+
+
+def _score_missing(query, chunks):
+    scores = get_rerank_model().predict(
+        [(query, chunk["content"]) for chunk in chunks],
+        batch_size=RERANK_BATCH_SIZE,
+        show_progress_bar=False
+    )
+    for chunk, score in zip(chunks, scores):
+        score_cache.put(_score_key(query, chunk["id"]), float(score))
+
+
+def rerank(query, chunks, top_k=RERANK_TOP_K, timeout=RERANK_TIMEOUT):
+    """Reorder retrieved chunks with a cross-encoder and keep the best `top_k`.
+
+    Candidates are scored in one batched CPU pass; scores are cached per
+    (query, chunk ID). If scoring does not finish within `timeout` seconds
+    the retrieval order is kept, and the pass still completes in the
+    background to fill the cache. No-op unless RERANK_ENABLED=1.
+    """
+    if not RERANK_ENABLED or not chunks:
+        return chunks
+
+    with span("rerank") as rerank_span:
+        return _rerank(query, chunks, top_k, timeout, rerank_span)
+
+
+def _rerank(query, chunks, top_k, timeout, rerank_span):
+    candidates = chunks[:RERANK_MAX_CANDIDATES]
+    missing = [c for c in candidates if score_cache.get(_score_key(query, c["id"])) is None]
+    rerank_span.set(candidates=len(candidates), cache_hits=len(candidates) - len(missing))
+
+    if missing:
+        future = _executor.submit(_score_missing, query, missing)
+        try:
+            future.result(timeout=timeout)
+        except TimeoutError:
+            logger.warning("Rerank exceeded %.1fs for %d candidates; keeping retrieval order", timeout, len(missing))
+            rerank_span.set(timed_out=True)
+            return chunks
+        except Exception as e:
+            logger.warning("Rerank failed: %s", e)
+            rerank_span.set(error=str(e))
+            return chunks
+
+    scored = [
+        (score_cache.get(_score_key(query, c["id"]), float("-inf")), rank, c)
+        for rank, c in enumerate(candidates)
+    ]
+    scored.sort(key=lambda item: (-item[0], item[1]))
+    return [c for _, _, c in scored[:top_k]]
@@ -0,0 +1,126 @@
+import os
+import time
+import hashlib
+from concurrent.futures import wait, FIRST_COMPLETED
+
+from ChatEngine import submit_translations
+from Caches import LRUCache
+from Embeddings import EMBEDDING_MODEL, get_embedding_function
+from IndexManager import get_lexical_index
+from Tracing import span
+
+EXPANSION_DEADLINE = float(os.getenv("EXPANSION_DEADLINE", "4"))
+HYBRID_SEARCH = os.getenv("HYBRID_SEARCH", "1") == "1"
+RRF_K = int(os.getenv("RRF_K", "60"))
+
+query_embedding_cache = LRUCache(int(os.getenv("QUERY_EMBEDDING_CACHE_ITEMS", "2048")))
+
+
+def query_embedding_key(text, model=EMBEDDING_MODEL):
+    return hashlib.sha256(f"{model}\x1f{text}".encode("utf-8")).hexdigest()
+
+
+def embed_queries(texts):
+    """Embed query texts through the LRU cache, encoding all misses in one batch."""
+    with span("embed", texts=len(texts)) as embed_span:
+        keys = [query_embedding_key(t) for t in texts]
+        embeddings = [query_embedding_cache.get(k) for k in keys]
+        missing = [i for i, e in enumerate(embeddings) if e is None]
+        embed_span.set(cache_hits=len(texts) - len(missing))
+
+        if missing:
+            encoded = get_embedding_function()([texts[i] for i in missing])
+            for i, embedding in zip(missing, encoded):
+                query_embedding_cache.put(keys[i], embedding)
+                embeddings[i] = embedding
+
+        return embeddings
+
+
+def query_collection(collection, texts, n_results):
+    embeddings = embed_queries(texts)
+    with span("query", queries=len(texts), n_results=n_results):
+        return collection.query(query_embeddings=embeddings, n_results=n_results)
+
+
+def reciprocal_rank_fusion(rankings, k=RRF_K):
+    """Fuse ranked ID lists; ties keep the order of first appearance."""
+    scores = {}
+    for ranking in rankings:
+        for rank, chunk_id in enumerate(ranking):
+            scores[chunk_id] = scores.get(chunk_id, 0.0) + 1.0 / (k + rank + 1)
+    order = {chunk_id: i for i, chunk_id in enumerate(scores)}
+    return sorted(scores, key=lambda chunk_id: (-scores[chunk_id], order[chunk_id]))
+
+
+def hybrid_search(collection, texts, n_results):
+    """Vector search fused with BM25 per query text; returns one chunk list per text."""
+    res = query_collection(collection, texts, n_results)
+    chunks_by_id = {}
+    vector_rankings = []
+    for ids, docs, metas in zip(res["ids"], res["documents"], res["metadatas"]):
+        for i, d, m in zip(ids, docs, metas):
+            chunks_by_id[i] = {"id": i, "content": d, "metadata": m}
+        vector_rankings.append(list(ids))
+
+    lexical = get_lexical_index()
+    if not HYBRID_SEARCH or not len(lexical):
+        return [[chunks_by_id[i] for i in ranking] for ranking in vector_rankings]
+
+    fused_rankings = []
+    with span("lexical", queries=len(texts)):
+        for text, ranking in zip(texts, vector_rankings):
+            lexical_ranking = [i for i, _ in lexical.search(text, n_results)]
+            fused_rankings.append(reciprocal_rank_fusion([ranking, lexical_ranking])[:n_results])
+
+    missing = list({i for ranking in fused_rankings for i in ranking if i not in chunks_by_id})
+    if missing:
+        got = collection.get(ids=missing, include=["documents", "metadatas"])
+        for i, d, m in zip(got["ids"], got["documents"], got["metadatas"]):
+            chunks_by_id[i] = {"id": i, "content": d, "metadata": m}
+
+    return [[chunks_by_id[i] for i in ranking if i in chunks_by_id] for ranking in fused_rankings]
+
+
+def fuse_results(rankings, k=RRF_K):
+    """Merge per-query chunk rankings into one deduplicated list ordered by RRF score."""
+    chunks_by_id = {}
+    id_rankings = []
+    for ranked in rankings:
+        for chunk in ranked:
+            chunks_by_id.setdefault(chunk["id"], chunk)
+        id_rankings.append([chunk["id"] for chunk in ranked])
+    return [chunks_by_id[i] for i in reciprocal_rank_fusion(id_rankings, k)]
+
+
+def retrieve_multilingual(query, collection, n_results=15, deadline=None, session=None):
+    """Search the original query right away and add translated variants as they arrive.
+
+    Translations run concurrently; any that are not back within `deadline`
+    seconds (EXPANSION_DEADLINE by default) are dropped for this turn.
+    Returns (queries, chunks) where chunks are deduplicated by ID and ranked
+    by reciprocal-rank fusion across all query variants. `session` is passed
+    to the LLM scheduler for fair queueing of the translation calls.
+    """
+    deadline = EXPANSION_DEADLINE if deadline is None else deadline
+    started = time.monotonic()
+    pending = set(submit_translations(query, collection, session).values())
+
+    queries = [query]
+    rankings = hybrid_search(collection, [query], n_results)
+
+    while pending:
+        remaining = deadline - (time.monotonic() - started)
+        if remaining <= 0:
+            break
+        done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+        fresh = []
+        for future in done:
+            translated = future.result()
+            if translated not in queries and translated not in fresh:
+                fresh.append(translated)
+        if fresh:
+            queries.extend(fresh)
+            rankings.extend(hybrid_search(collection, fresh, n_results))
+
+    return queries, fuse_results(rankings)
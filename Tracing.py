@@ -0,0 +1,218 @@
+import os
+import json
+import time
+import uuid
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+
+CACHE_FOLDER = os.getenv("CACHE_FOLDER", "./cache")
+# Empty string disables the JSONL export; aggregates are still kept in memory.
+TRACE_FILE = os.getenv("TRACE_FILE", os.path.join(CACHE_FOLDER, "traces.jsonl"))
+# Past this size the export rolls over to TRACE_FILE + ".1" (one old file kept); 0 never rolls.
+TRACE_FILE_MAX_BYTES = int(os.getenv("TRACE_FILE_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_WINDOW = int(os.getenv("TRACE_WINDOW", "500"))
+LAST_TRACES = 1000
+HISTOGRAM_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, float("inf"))
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+
+_stats = {}
+_stats_lock = threading.Lock()
+_export_lock = threading.Lock()
+_last_traces = {}
+
+
+class Span:
+    """One timed stage of a turn; attributes hold sizes, token counts, cache hits and retries."""
+
+    def __init__(self, trace, stage, parent=None, **attrs):
+        self.trace = trace
+        self.stage = stage
+        self.parent = parent
+        self.attrs = dict(attrs)
+        self.started = time.perf_counter()
+        self.duration = None
+        self.id = trace.add(self) if trace is not None else None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def end(self, **attrs):
+        """Stop the clock; later calls only add attributes."""
+        self.attrs.update(attrs)
+        if self.duration is None:
+            self.duration = time.perf_counter() - self.started
+            if self.trace is not None:
+                _observe(self.stage, self.duration)
+
+    def to_dict(self):
+        return {
+            "id": self.id,
+            "stage": self.stage,
+            "parent": self.parent.id if self.parent is not None else None,
+            "start": self.started - self.trace.started,
+            "duration": self.duration,
+            "attrs": self.attrs,
+        }
+
+
+class Trace:
+    def __init__(self, name, **attrs):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.attrs = dict(attrs)
+        self.timestamp = time.time()
+        self.started = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def add(self, span):
+        with self._lock:
+            self.spans.append(span)
+            return len(self.spans) - 1
+
+    def to_dict(self):
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration": self.duration,
+            "attrs": self.attrs,
+            # Spans still open here (e.g. translations past the deadline) have duration None.
+            "spans": [s.to_dict() for s in spans],
+        }
+
+
+def _observe(stage, seconds):
+    with _stats_lock:
+        entry = _stats.setdefault(stage, {
+            "count": 0,
+            "total_seconds": 0.0,
+            "recent": deque(maxlen=TRACE_WINDOW),
+            "buckets": [0] * len(HISTOGRAM_BUCKETS),
+        })
+        entry["count"] += 1
+        entry["total_seconds"] += seconds
+        entry["recent"].append(seconds)
+        for i, upper in enumerate(HISTOGRAM_BUCKETS):
+            if seconds <= upper:
+                entry["buckets"][i] += 1
+                break
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q in 0..1) of `values`; 0.0 when empty."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def get_stage_stats():
+    """Per-stage counts, p50/p95 over the recent window and a cumulative latency histogram (seconds)."""
+    with _stats_lock:
+        return {
+            stage: {
+                "count": entry["count"],
+                "mean": entry["total_seconds"] / entry["count"] if entry["count"] else 0.0,
+                "p50": percentile(entry["recent"], 0.50),
+                "p95": percentile(entry["recent"], 0.95),
+                "max": max(entry["recent"]) if entry["recent"] else 0.0,
+                "histogram": {
+                    ("+Inf" if upper == float("inf") else str(upper)): count
+                    for upper, count in zip(HISTOGRAM_BUCKETS, entry["buckets"])
+                },
+            }
+            for stage, entry in _stats.items()
+        }
+
+
+def get_last_trace(session=None):
+    return _last_traces.get(session)
+
+
+def _export(record):
+    if not TRACE_FILE:
+        return
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+    with _export_lock:
+        try:
+            if TRACE_FILE_MAX_BYTES and os.path.getsize(TRACE_FILE) >= TRACE_FILE_MAX_BYTES:
+                os.replace(TRACE_FILE, TRACE_FILE + ".1")
+        except OSError:
+            pass
+        try:
+            with open(TRACE_FILE, "a", encoding="utf-8") as f:
+                f.write(line)
+        except OSError:
+            pass
+
+
+@contextmanager
+def trace_turn(name, session=None, **attrs):
+    """Collect spans for one turn; on exit the trace is exported as a JSONL line.
+
+    Worker threads see the trace only when run with a copied context
+    (contextvars.copy_context().run).
+    """
+    trace = Trace(name, session=session, **attrs)
+    token = _current_trace.set(trace)
+    span_token = _current_span.set(None)
+    try:
+        yield trace
+    except Exception as e:
+        trace.attrs["error"] = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(span_token)
+        _current_trace.reset(token)
+        trace.duration = time.perf_counter() - trace.started
+        _observe("turn", trace.duration)
+        record = trace.to_dict()
+        _last_traces.pop(session, None)
+        _last_traces[session] = record
+        while len(_last_traces) > LAST_TRACES:
+            del _last_traces[next(iter(_last_traces))]
+        _export(record)
+
+
+def start_span(stage, **attrs):
+    """Open a span in the current trace without making it current; call .end() when done."""
+    return Span(_current_trace.get(), stage, _current_span.get(), **attrs)
+
+
+@contextmanager
+def use_span(span):
+    """Make `span` the target of annotate_span() without ending it."""
+    token = _current_span.set(span)
+    try:
+        yield span
+    finally:
+        _current_span.reset(token)
+
+
+@contextmanager
+def span(stage, **attrs):
+    current = start_span(stage, **attrs)
+    token = _current_span.set(current)
+    try:
+        yield current
+    except Exception as e:
+        current.set(error=f"{type(e).__name__}: {e}")
+        raise
+    finally:
+        _current_span.reset(token)
+        current.end()
+
+
+def annotate_span(**attrs):
+    """Add attributes to the innermost open span, if any."""
+    current = _current_span.get()
+    if current is not None:
+        current.set(**attrs)
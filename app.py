@@ -1,21 +1,8 @@
 import streamlit as st
 import uuid
-import chromadb
-import os
-import re
-import time
 from styles import load_custom_css
 
-from DocumentProcessor import (
-    get_files_from_folder,
-    get_file_hash,
-    load_cache,
-    extract_pdf_detailed,
-    extract_docx_detailed,
-    extract_txt_detailed,
-    save_cache
-)
-from ChatEngine import get_embedding_function, answer_question_with_groq,expand_query_multilingual
+from ChatClient import ServiceError, get_health, service_url, stream_answer, sync_index
 
 st.set_page_config(
     page_title="Biomedical Document Chatbot",
@@ -27,111 +14,70 @@ st.set_page_config(
 load_custom_css()
 
 DOCS_FOLDER =  "/mount/src/lasst/documents"
-CACHE_FOLDER = os.getenv("CACHE_FOLDER", "./cache")
-CHROMA_FOLDER = "./chroma_db"
-
-os.makedirs(DOCS_FOLDER, exist_ok=True)
-os.makedirs(CACHE_FOLDER, exist_ok=True)
-os.makedirs(CHROMA_FOLDER, exist_ok=True)
-
-if "collection" not in st.session_state:
-    st.session_state.collection = None
 
 if "chats" not in st.session_state:
     st.session_state.chats = {}
     st.session_state.active_chat = None
 
-client = chromadb.PersistentClient(path=CHROMA_FOLDER)  
-
-collections = client.list_collections()
-
-if collections:
-    collection = client.get_collection(
-        name=collections[0].name,
-        embedding_function=get_embedding_function()
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+    st.session_state.last_trace = None
+
+try:
+    health = get_health()
+except ServiceError as e:
+    st.error(f"🚨 {e}")
+    st.stop()
+if health is None:
+    st.error(f"🚨 Chat service is not reachable at {service_url()}.")
+    st.code("python ChatService.py")
+    st.stop()
+
+if not health["chunks"]:
+    st.warning(
+        "📚 No document index found. Build it offline with `python ingest.py` "
+        "and reload this page."
     )
-    st.session_state.collection = collection
-else:
-    with st.spinner("📚 Processing documents... This may take a while for the first time."):
-        files = get_files_from_folder()
-        st.write("🔍 Searching for documents in:")
-        st.code(DOCS_FOLDER)
-        st.write(f"Found {len(files)} files:")
-        if files:
-            for f in files:
-                st.write(f"- {f}")
-        else:
-            st.error("🚨 No files found! Check the folder path and file extensions.")
-            st.stop()
-        if not files:
-            st.error("No documents found in the documents folder!")
-            st.stop()
-
-        collection = client.create_collection(
-            name="biomed_docs",
-            embedding_function=get_embedding_function(),
-            metadata={"hnsw:space": "cosine"}  
-        )
-
-        all_chunks = []
-        all_meta = {}
-        all_ids = []
-
-        processed_files = []  
-        processed_count = 0  
-
-        for idx, path in enumerate(files):
-            name = os.path.basename(path)
-            ext = name.split(".")[-1].lower()
-            key = f"{get_file_hash(path)}_{ext}"
-            cached = load_cache(key)
-
-            if cached:
-                info = cached
-                st.success(f"✅ Loaded from cache: {name}") 
-            else:
-                st.info(f"🔄 Processing: {name} ...") 
-                if ext == "pdf":
-                    info, error = extract_pdf_detailed(path)
-                elif ext in ["doc", "docx"]:
-                    info, error = extract_docx_detailed(path)
-                elif ext == "txt":
-                    info, error = extract_txt_detailed(path)
-                else:
-                    st.warning(f"⚠️ Skipped unsupported file: {name}")
-                    continue
-                if error:
-                    st.warning(f"⚠️ Error in {name}: {error}")
-                    continue
-                save_cache(key, info)
-
-            st.success(f"✅ Processed successfully: {name}")
-            processed_files.append(name)
-            processed_count += 1
-
-            for c in info["chunks"]:
-                all_chunks.append(c["content"])
-                all_meta[len(all_chunks) - 1] = c["metadata"]
-                all_ids.append(f"chunk_{idx}_{len(all_chunks)}")
-
-        if processed_count > 0:
-            st.success(f"🎉 All done! Processed {processed_count} documents successfully!")
-            st.write("**Processed documents:**")
-            for file_name in processed_files:
-                st.write(f"- {file_name}")
+    st.code(f"python ingest.py --docs {DOCS_FOLDER}")
+    if not st.button("📚 Build index now", type="primary"):
+        st.stop()
+
+    with st.spinner("📚 Building the document index..."):
+        result = sync_index()
+
+    for entry in result["messages"]:
+        getattr(st, entry["level"])(entry["message"])
+    summary = result["summary"]
+    st.success(
+        f"🎉 Index built: {len(summary['added'])} documents, "
+        f"{summary['chunks_written']} chunks written."
+    )
+    if summary["failed"]:
+        st.error(f"❌ {len(summary['failed'])} documents could not be processed.")
+    health = get_health() or health
+
+def render_debug_panel(placeholder, trace, stages):
+    with placeholder.container():
+        st.markdown("### 🔍 Last turn")
+        if not trace:
+            st.caption("No traced turn yet.")
         else:
-            st.error("❌ No documents were processed!")
-
-        batch_size = 300
-        for i in range(0, len(all_chunks), batch_size):
-            collection.add(
-                documents=all_chunks[i:i+batch_size],
-                metadatas=[all_meta[j] for j in range(i, min(i+batch_size, len(all_chunks)))],
-                ids=all_ids[i:i+batch_size]
-            )
-
-        st.session_state.collection = collection
-        st.success(f"✅ Processed {len(files)} documents successfully!")
+            st.caption(f"Total {trace['duration'] * 1000:.0f} ms")
+            st.table([
+                {
+                    "stage": s["stage"],
+                    "start ms": round(s["start"] * 1000),
+                    "ms": round(s["duration"] * 1000) if s["duration"] is not None else None,
+                    "details": ", ".join(f"{k}={v}" for k, v in s["attrs"].items() if v is not None),
+                }
+                for s in trace["spans"]
+            ])
+        if stages:
+            st.markdown("### ⏱️ Stage latency (service)")
+            st.table([
+                {"stage": stage, "n": s["count"], "p50 ms": round(s["p50"] * 1000), "p95 ms": round(s["p95"] * 1000)}
+                for stage, s in sorted(stages.items())
+            ])
 
 if not st.session_state.chats:
     cid = f"chat_{uuid.uuid4().hex[:6]}"
@@ -171,6 +117,21 @@ with st.sidebar:
         st.session_state.active_chat = cid
         st.rerun()
 
+    embedding_stats = health["embedding"]
+    if embedding_stats["loaded"] and embedding_stats["rss_mb_after"] is not None:
+        st.caption(
+            f"🧠 Embedding model loaded in {embedding_stats['load_seconds']:.1f}s "
+            f"(RSS {embedding_stats['rss_mb_after']:.0f} MB)"
+        )
+
+    scheduler_stats = health["scheduler"]
+    answer_wait = scheduler_stats["wait"].get("answer_stream", {})
+    st.caption(
+        f"🚦 Groq queue: {scheduler_stats['queue_depth']} waiting"
+        f" • answer wait p95 {answer_wait.get('p95', 0.0):.1f}s"
+        + (f" • paused {scheduler_stats['blocked_for']:.0f}s" if scheduler_stats["blocked_for"] else "")
+    )
+
     st.markdown("### 💬 Your Chats")
     for cid in reversed(list(st.session_state.chats.keys())):   
         chat = st.session_state.chats[cid]
@@ -186,6 +147,11 @@ with st.sidebar:
                     st.session_state.active_chat = next(iter(st.session_state.chats), None)
                 st.rerun()
 
+    show_debug = st.checkbox("🔍 Show latency breakdown", key="show_debug")
+    debug_panel = st.empty()
+    if show_debug:
+        render_debug_panel(debug_panel, st.session_state.last_trace, health["stages"])
+
 chat = st.session_state.chats[st.session_state.active_chat]
 for m in chat["messages"]:
     with st.chat_message(m["role"]):
@@ -201,42 +167,26 @@ if query := st.chat_input("Ask anything about the MBE program documents..."):
 
     with st.chat_message("assistant"):
         with st.spinner("Searching documents & thinking..."):
-            queries = expand_query_multilingual(
-                query,
-                st.session_state.collection
-            )
-
-            res = st.session_state.collection.query(
-                query_texts=queries,
-                n_results=15
-            )
-            chunks = []
-            for docs, metas in zip(res["documents"], res["metadatas"]):
-                for d, m in zip(docs, metas):
-                    chunks.append({
-                        "content": d,
-                        "metadata": m
-                    })
-
-            answer, used_chunks = answer_question_with_groq(query, chunks, chat["messages"])
-            st.markdown(answer)
-
-            match = re.search(r'wait (\d+) seconds', answer.lower())
-            if match:
-                remaining = int(match.group(1))
-                countdown = st.empty()
-                while remaining > 0:
-                    countdown.warning(f"⏳ Please wait {remaining} seconds before sending a new request...")
-                    time.sleep(1)
-                    remaining -= 1
-                countdown.success("✅ You can now send a new question.")
-
-            st.markdown("### 📚 Answer was based on the following document excerpts:")
-            for i, ch in enumerate(used_chunks, 1):
-                with st.expander(f"📄 {ch['source']} — Page {ch['page']}"):
-                    st.markdown(ch["content"])
+            try:
+                context, tokens = stream_answer(
+                    query, chat["messages"], n_results=10, session_id=st.session_state.session_id
+                )
+            except ServiceError as e:
+                context, tokens = {"chunks": [], "used_chunks": []}, iter([f"❌ Error: {str(e)}"])
+            chunks = context["chunks"]
+            used_chunks = context["used_chunks"]
+
+        answer = st.write_stream(tokens)
+
+        st.markdown("### 📚 Answer was based on the following document excerpts:")
+        for i, ch in enumerate(used_chunks, 1):
+            with st.expander(f"📄 {ch['source']} — Page {ch['page']}"):
+                st.markdown(ch["content"])
 
     chat["messages"].append({"role": "assistant", "content": answer})
     chat["context"] = chunks
+    st.session_state.last_trace = context.get("trace")
+    if show_debug:
+        render_debug_panel(debug_panel, st.session_state.last_trace, (get_health() or health)["stages"])
     
 
@@ -0,0 +1,435 @@
+"""Reproducible ingestion and retrieval benchmarks over the bundled documents.
+
+    python benchmark.py                       # all stages, results in benchmarks/results/
+    python benchmark.py --repeats 5 --output before.json
+
+Stages:
+    extraction  extract_pdf_detailed per PDF, split into text, tables and OCR
+    embedding   chunk embedding throughput
+    chroma      add (per batch) and query latency percentiles, source recall
+    answer      end-to-end turn latency against a local mock Groq endpoint
+
+Everything runs against fresh cache and Chroma folders in a temp directory, so
+results do not depend on earlier runs. Results are written as sorted JSON
+that can be diffed between versions.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+STAGES = ["extraction", "embedding", "chroma", "answer"]
+MOCK_FIRST_TOKEN_DELAY = float(os.getenv("MOCK_FIRST_TOKEN_DELAY", "0.15"))
+MOCK_TOKEN_DELAY = float(os.getenv("MOCK_TOKEN_DELAY", "0.005"))
+MOCK_ANSWER = (
+    "According to the provided documents, the requested regulation is described in the "
+    "study and examination regulations. Please check the cited pages for the exact "
+    "deadlines, forms and responsible offices."
+)
+
+
+def summarize(values):
+    """Count, mean and p50/p95/max of a list of seconds."""
+    if not values:
+        return {"n": 0}
+    arr = np.asarray(values, dtype=np.float64)
+    return {
+        "n": len(values),
+        "mean": float(arr.mean()),
+        "p50": float(np.percentile(arr, 50)),
+        "p95": float(np.percentile(arr, 95)),
+        "max": float(arr.max()),
+    }
+
+
+class MockGroqHandler(BaseHTTPRequestHandler):
+    """OpenAI-compatible /chat/completions with fixed latency and generous rate-limit headers."""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _rate_limit_headers(self):
+        self.send_header("x-ratelimit-limit-requests", "100000")
+        self.send_header("x-ratelimit-remaining-requests", "99999")
+        self.send_header("x-ratelimit-reset-requests", "1s")
+        self.send_header("x-ratelimit-limit-tokens", "10000000")
+        self.send_header("x-ratelimit-remaining-tokens", "9999999")
+        self.send_header("x-ratelimit-reset-tokens", "1s")
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        time.sleep(MOCK_FIRST_TOKEN_DELAY)
+
+        if not body.get("stream"):
+            prompt = body["messages"][-1]["content"]
+            lines = [line for line in prompt.strip().splitlines() if line.strip()]
+            # Translation prompts end with the question; answers get the canned text.
+            content = f"(translated) {lines[-1]}" if body.get("max_tokens") is None else MOCK_ANSWER
+            payload = json.dumps({
+                "choices": [{"message": {"role": "assistant", "content": content}}],
+                "usage": {"prompt_tokens": len(prompt) // 4, "completion_tokens": len(content) // 4},
+            }).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self._rate_limit_headers()
+            self.end_headers()
+            self.wfile.write(payload)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self._rate_limit_headers()
+        self.end_headers()
+        for word in MOCK_ANSWER.split(" "):
+            event = {"choices": [{"delta": {"content": word + " "}}]}
+            self.wfile.write(f"data: {json.dumps(event)}\n\n".encode("utf-8"))
+            self.wfile.flush()
+            time.sleep(MOCK_TOKEN_DELAY)
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.close_connection = True
+
+
+def start_mock_groq():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), MockGroqHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return None
+
+
+def bench_extraction(pdfs, repeats):
+    import DocumentProcessor
+
+    results = {"files": {}}
+    documents = {}
+    for path in pdfs:
+        name = os.path.basename(path)
+        runs = []
+        info = error = None
+        for _ in range(repeats):
+            # Fresh OCR cache each run so OCR time is actually measured.
+            shutil.rmtree(DocumentProcessor.OCR_CACHE_FOLDER, ignore_errors=True)
+            os.makedirs(DocumentProcessor.OCR_CACHE_FOLDER, exist_ok=True)
+            started = time.perf_counter()
+            try:
+                info, error = DocumentProcessor.extract_pdf_detailed(path, workers=1)
+            except Exception as e:
+                info, error = None, f"{type(e).__name__}: {e}"
+            elapsed = time.perf_counter() - started
+            if error:
+                break
+            runs.append((elapsed, info["timings"]))
+        if error:
+            results["files"][name] = {"error": error}
+            continue
+
+        elapsed, timings = sorted(runs, key=lambda run: run[0])[len(runs) // 2]
+        chunks = len(info["chunks"])
+        results["files"][name] = {
+            "pages": info["total_pages"],
+            "tables": info["total_tables"],
+            "chunks": chunks,
+            "seconds": elapsed,
+            "seconds_all_runs": [run[0] for run in runs],
+            "text_seconds": timings["text"],
+            "tables_seconds": timings["tables"],
+            "ocr_seconds": timings["ocr"],
+            "ocr_pages": timings["ocr_pages"],
+            "chunking_seconds": max(0.0, elapsed - timings["text"] - timings["tables"] - timings["ocr"]),
+            "pages_per_second": info["total_pages"] / elapsed,
+            "chunks_per_second": chunks / elapsed,
+            "table_pages_skipped": info.get("table_prefilter", {}).get("pages_skipped", 0),
+        }
+        documents[path] = info
+
+    measured = [r for r in results["files"].values() if "error" not in r]
+    total_seconds = sum(r["seconds"] for r in measured)
+    results["total"] = {
+        "files": len(measured),
+        "failed": len(results["files"]) - len(measured),
+        "pages": sum(r["pages"] for r in measured),
+        "chunks": sum(r["chunks"] for r in measured),
+        "seconds": total_seconds,
+        "text_seconds": sum(r["text_seconds"] for r in measured),
+        "tables_seconds": sum(r["tables_seconds"] for r in measured),
+        "ocr_seconds": sum(r["ocr_seconds"] for r in measured),
+        "pages_per_second": sum(r["pages"] for r in measured) / total_seconds if total_seconds else 0.0,
+        "chunks_per_second": sum(r["chunks"] for r in measured) / total_seconds if total_seconds else 0.0,
+    }
+    return results, documents
+
+
+def bench_embedding(documents):
+    import IndexManager
+    from Embeddings import get_embedding_function, get_embedding_stats
+
+    texts = [c["content"] for info in documents.values() for c in info["chunks"]]
+    embed = get_embedding_function()
+    embed(texts[:1])
+
+    batch_seconds = []
+    embeddings = []
+    started = time.perf_counter()
+    for i in range(0, len(texts), IndexManager.EMBED_BATCH_SIZE):
+        batch_started = time.perf_counter()
+        embeddings.extend(embed(texts[i:i + IndexManager.EMBED_BATCH_SIZE]))
+        batch_seconds.append(time.perf_counter() - batch_started)
+    elapsed = time.perf_counter() - started
+
+    stats = get_embedding_stats()
+    results = {
+        "model": stats["model"],
+        "load_seconds": stats["load_seconds"],
+        "rss_mb_after_load": stats["rss_mb_after"],
+        "batch_size": IndexManager.EMBED_BATCH_SIZE,
+        "chunks": len(texts),
+        "seconds": elapsed,
+        "chunks_per_second": len(texts) / elapsed if elapsed else 0.0,
+        "batch_seconds": summarize(batch_seconds),
+    }
+    return results, embeddings
+
+
+def bench_chroma(documents, embeddings, questions, repeats, n_results):
+    import chromadb
+    import IndexManager
+    from DocumentProcessor import get_file_hash, detect_doc_language
+    from Embeddings import get_embedding_function
+    from Retriever import embed_queries, hybrid_search
+
+    client = chromadb.PersistentClient(path=IndexManager.CHROMA_FOLDER)
+    collection, manifest = IndexManager.open_collection(client, get_embedding_function())
+    lexical = IndexManager.get_lexical_index()
+
+    ids, docs, metas, sources = [], [], [], []
+    for path, info in documents.items():
+        name = os.path.basename(path)
+        file_hash = get_file_hash(path)
+        doc_id = IndexManager.make_doc_id(name, file_hash)
+        ids.extend(IndexManager.make_chunk_id(doc_id, n) for n in range(len(info["chunks"])))
+        docs.extend(c["content"] for c in info["chunks"])
+        metas.extend(c["metadata"] for c in info["chunks"])
+        sources.extend([name] * len(info["chunks"]))
+        manifest["files"][name] = {
+            "hash": file_hash,
+            "doc_id": doc_id,
+            "lang": detect_doc_language(name),
+            "chunks": len(info["chunks"]),
+            "tables": info["total_tables"],
+            "pages": info["total_pages"],
+        }
+
+    add_seconds = []
+    started = time.perf_counter()
+    for i in range(0, len(ids), IndexManager.ADD_BATCH_SIZE):
+        batch = slice(i, i + IndexManager.ADD_BATCH_SIZE)
+        batch_started = time.perf_counter()
+        collection.upsert(ids=ids[batch], documents=docs[batch], metadatas=metas[batch], embeddings=embeddings[batch])
+        add_seconds.append(time.perf_counter() - batch_started)
+    add_total = time.perf_counter() - started
+    lexical.add(ids, docs, sources)
+    lexical.save()
+    IndexManager.save_manifest(manifest)
+    IndexManager.save_catalog(IndexManager.build_catalog(manifest))
+
+    query_seconds = []
+    hybrid_seconds = []
+    hits = 0
+    for question in questions:
+        embedding = embed_queries([question["question"]])
+        for _ in range(repeats):
+            query_started = time.perf_counter()
+            collection.query(query_embeddings=embedding, n_results=n_results)
+            query_seconds.append(time.perf_counter() - query_started)
+        hybrid_started = time.perf_counter()
+        ranking = hybrid_search(collection, [question["question"]], n_results)[0]
+        hybrid_seconds.append(time.perf_counter() - hybrid_started)
+        found = {chunk["metadata"].get("source") for chunk in ranking}
+        hits += bool(found & set(question["expected_sources"]))
+
+    results = {
+        "chunks": collection.count(),
+        "add_batch_size": IndexManager.ADD_BATCH_SIZE,
+        "add_seconds": add_total,
+        "add_chunks_per_second": len(ids) / add_total if add_total else 0.0,
+        "add_batch_seconds": summarize(add_seconds),
+        "query_seconds": summarize(query_seconds),
+        "hybrid_search_seconds": summarize(hybrid_seconds),
+        "n_results": n_results,
+        "source_recall": hits / len(questions) if questions else 0.0,
+    }
+    return results, collection
+
+
+def bench_answer(collection, questions, repeats, n_results):
+    import ChatEngine
+    import Reranker
+    import Retriever
+    from LLMClient import get_latency_stats, get_scheduler_stats
+
+    first_token_seconds = []
+    total_seconds = []
+    retrieve_seconds = []
+    for question in questions:
+        for _ in range(repeats):
+            # Cold turn: no cached translations, query embeddings, rerank scores or answers.
+            ChatEngine.translation_cache.clear()
+            ChatEngine.answer_cache.clear()
+            Retriever.query_embedding_cache.clear()
+            Reranker.score_cache.clear()
+
+            started = time.perf_counter()
+            queries, chunks = Retriever.retrieve_multilingual(question["question"], collection, n_results=n_results)
+            chunks = Reranker.rerank(question["question"], chunks)
+            retrieved = time.perf_counter()
+            tokens, used_chunks = ChatEngine.stream_answer_with_groq(question["question"], chunks, [])
+            first = None
+            for _ in tokens:
+                if first is None:
+                    first = time.perf_counter()
+            finished = time.perf_counter()
+
+            retrieve_seconds.append(retrieved - started)
+            first_token_seconds.append((first or finished) - started)
+            total_seconds.append(finished - started)
+
+    return {
+        "turns": len(total_seconds),
+        "mock_first_token_delay": MOCK_FIRST_TOKEN_DELAY,
+        "mock_token_delay": MOCK_TOKEN_DELAY,
+        "retrieve_seconds": summarize(retrieve_seconds),
+        "first_token_seconds": summarize(first_token_seconds),
+        "total_seconds": summarize(total_seconds),
+        "llm_calls": get_latency_stats(),
+        "scheduler": get_scheduler_stats(),
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark extraction, embedding, Chroma and answer latency.")
+    parser.add_argument("--docs", default=os.path.join(ROOT, "documents"),
+                        help="folder with the benchmark PDFs (default: %(default)s)")
+    parser.add_argument("--questions", default=os.path.join(ROOT, "benchmarks", "golden_questions.json"),
+                        help="golden question set (default: %(default)s)")
+    parser.add_argument("--repeats", type=int, default=3,
+                        help="runs per document / question; the median run is reported (default: %(default)s)")
+    parser.add_argument("--n-results", type=int, default=10,
+                        help="chunks retrieved per query (default: %(default)s)")
+    parser.add_argument("--stages", default=",".join(STAGES),
+                        help="comma-separated subset of: " + ", ".join(STAGES))
+    parser.add_argument("--output",
+                        help="results file (default: benchmarks/results/<commit>-<timestamp>.json)")
+    parser.add_argument("--keep", action="store_true",
+                        help="keep the temporary cache and Chroma folders")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    stages = [s.strip() for s in args.stages.split(",") if s.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        print(f"Unknown stages: {', '.join(sorted(unknown))}", file=sys.stderr)
+        return 2
+
+    work_dir = tempfile.mkdtemp(prefix="lasst-bench-")
+    mock = start_mock_groq()
+    # Must be set before the repo modules are imported: they read these at import time.
+    os.environ["CACHE_FOLDER"] = os.path.join(work_dir, "cache")
+    os.environ["CHROMA_FOLDER"] = os.path.join(work_dir, "chroma")
+    os.environ["GROQ_BASE_URL"] = f"http://127.0.0.1:{mock.server_address[1]}"
+    os.environ.setdefault("GROQ_API_KEY", "benchmark")
+    os.environ.setdefault("LLM_RATE_LIMIT_RPM", "100000")
+    os.environ.setdefault("LLM_RATE_LIMIT_TPM", "10000000")
+    sys.path.insert(0, ROOT)
+
+    import fitz
+    import chromadb
+    import DocumentProcessor
+
+    with open(args.questions, "r", encoding="utf-8") as f:
+        questions = json.load(f)
+    pdfs = sorted(p for p in DocumentProcessor.get_files_from_folder(args.docs) if p.lower().endswith(".pdf"))
+
+    commit = git_commit()
+    results = {
+        "meta": {
+            "commit": commit,
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "pymupdf": fitz.VersionBind,
+            "chromadb": chromadb.__version__,
+            "documents": [os.path.basename(p) for p in pdfs],
+            "questions": len(questions),
+            "repeats": args.repeats,
+            "table_prefilter": DocumentProcessor.TABLE_PREFILTER,
+        },
+    }
+
+    documents = embeddings = collection = None
+    try:
+        for stage in stages:
+            print(f"[bench] {stage}...", flush=True)
+            try:
+                if stage == "extraction":
+                    results["extraction"], documents = bench_extraction(pdfs, args.repeats)
+                elif documents is None:
+                    results[stage] = {"skipped": "needs the extraction stage"}
+                elif stage == "embedding":
+                    results["embedding"], embeddings = bench_embedding(documents)
+                elif embeddings is None:
+                    results[stage] = {"skipped": "needs the embedding stage"}
+                elif stage == "chroma":
+                    results["chroma"], collection = bench_chroma(
+                        documents, embeddings, questions, args.repeats, args.n_results
+                    )
+                elif collection is None:
+                    results[stage] = {"skipped": "needs the chroma stage"}
+                else:
+                    results["answer"] = bench_answer(collection, questions, args.repeats, args.n_results)
+            except Exception as e:
+                results[stage] = {"error": f"{type(e).__name__}: {e}"}
+                print(f"[bench] {stage} failed: {e}", file=sys.stderr)
+    finally:
+        mock.shutdown()
+        if not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    output = args.output or os.path.join(
+        ROOT, "benchmarks", "results",
+        f"{commit or 'nogit'}-{datetime.now().strftime('%Y%m%d-%H%M%S')}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"[bench] results written to {output}")
+    return 1 if any("error" in results.get(stage, {}) for stage in stages) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+"""Build or update the document index outside of Streamlit.
+
+    python ingest.py --docs ./documents --workers 4
+
+Extracts, chunks and embeds the documents and syncs them into ./chroma_db,
+which app.py then only has to open. A running ChatService picks up the
+new index on its next request; no restart is needed.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+
+import chromadb
+
+import DocumentProcessor
+import IndexManager
+from DocumentProcessor import get_files_from_folder, validate_table_prefilter
+from IndexManager import CHROMA_FOLDER, COLLECTION_NAME, MANIFEST_FILE, open_collection, sync_collection
+from Embeddings import get_embedding_function, get_embedding_stats
+
+LEVEL_PREFIX = {"info": "[info]", "success": "[ ok ]", "warning": "[warn]"}
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Build or update the document index.")
+    parser.add_argument("--docs", default=DocumentProcessor.DOCS_FOLDER,
+                        help="folder with the PDF/DOCX/TXT documents (default: %(default)s)")
+    parser.add_argument("--workers", type=int, default=DocumentProcessor.PDF_WORKERS,
+                        help="processes for PDF page extraction (default: %(default)s)")
+    parser.add_argument("--embed-batch-size", type=int, default=IndexManager.EMBED_BATCH_SIZE,
+                        help="chunks per embedding/upsert batch (default: %(default)s)")
+    parser.add_argument("--reset", action="store_true",
+                        help="drop the existing collection and manifest and rebuild from scratch")
+    parser.add_argument("--validate-tables", action="store_true",
+                        help="only compare the table pre-filter against full table detection and print a JSON report")
+    return parser.parse_args(argv)
+
+
+def print_progress(level, message):
+    print(f"{LEVEL_PREFIX.get(level, '[....]')} {message}", flush=True)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    files = sorted(get_files_from_folder(args.docs))
+    if not files:
+        print(f"No documents found in {args.docs}", file=sys.stderr)
+        return 1
+
+    if args.validate_tables:
+        pdfs = [f for f in files if f.lower().endswith(".pdf")]
+        print(json.dumps(validate_table_prefilter(pdfs, args.workers), indent=2))
+        return 0
+
+    IndexManager.EMBED_BATCH_SIZE = args.embed_batch_size
+
+    client = chromadb.PersistentClient(path=CHROMA_FOLDER)
+    if args.reset:
+        names = [c.name if hasattr(c, "name") else c for c in client.list_collections()]
+        if COLLECTION_NAME in names:
+            client.delete_collection(COLLECTION_NAME)
+        if os.path.exists(MANIFEST_FILE):
+            os.remove(MANIFEST_FILE)
+
+    print_progress("info", f"Syncing {len(files)} documents from {args.docs} into {CHROMA_FOLDER} "
+                           f"({args.workers} extraction workers)")
+    started = time.perf_counter()
+    collection, manifest = open_collection(client, get_embedding_function())
+    summary = sync_collection(collection, manifest, files, progress=print_progress, workers=args.workers)
+    elapsed = time.perf_counter() - started
+
+    written = summary["added"] + summary["changed"]
+    pages = sum(manifest["files"][name]["pages"] for name in written)
+    chunks = summary["chunks_written"]
+    encoded = summary["embeddings"]["encoded"]
+    rate = lambda n: n / elapsed if elapsed > 0 else 0.0
+
+    print()
+    print(f"Documents: {len(summary['added'])} added, {len(summary['changed'])} changed, "
+          f"{len(summary['removed'])} removed, {len(summary['unchanged'])} unchanged, "
+          f"{len(summary['failed'])} failed")
+    print(f"Collection: {collection.count()} chunks")
+    print(f"Elapsed: {elapsed:.1f}s")
+    print(f"Throughput: {rate(pages):.2f} pages/s, {rate(chunks):.2f} chunks/s, "
+          f"{rate(encoded):.2f} embeddings/s "
+          f"({summary['embeddings']['reused']} embeddings reused)")
+    embedding_stats = get_embedding_stats()
+    if embedding_stats["loaded"]:
+        print(f"Embedding model: loaded in {embedding_stats['load_seconds']:.1f}s")
+
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
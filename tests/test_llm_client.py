@@ -0,0 +1,48 @@
+import pytest
+
+from LLMClient import RateLimitExceeded, RateLimitScheduler
+
+# As sent by Groq: the request headers count per day (RPD), the token headers per minute (TPM).
+GROQ_HEADERS = {
+    "x-ratelimit-limit-requests": "14400",
+    "x-ratelimit-remaining-requests": "14370",
+    "x-ratelimit-reset-requests": "2m59.56s",
+    "x-ratelimit-limit-tokens": "18000",
+    "x-ratelimit-remaining-tokens": "17900",
+    "x-ratelimit-reset-tokens": "7.66s",
+}
+
+
+def test_daily_request_headers_keep_rpm_pacing():
+    scheduler = RateLimitScheduler(requests_per_minute=2, tokens_per_minute=18000)
+    scheduler.update(GROQ_HEADERS)
+
+    scheduler.acquire(10)
+    scheduler.acquire(10)
+    with pytest.raises(RateLimitExceeded) as exc:
+        scheduler.acquire(10, max_wait=0)
+
+    assert exc.value.wait_seconds == pytest.approx(30, abs=1)
+    assert scheduler.stats()["requests_remaining_today"] == 14368
+
+
+def test_exhausted_daily_quota_holds_until_reset():
+    scheduler = RateLimitScheduler(requests_per_minute=30, tokens_per_minute=18000)
+    scheduler.update(dict(GROQ_HEADERS, **{"x-ratelimit-remaining-requests": "0"}))
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        scheduler.acquire(10, max_wait=0)
+
+    assert exc.value.wait_seconds == pytest.approx(179.56, abs=1)
+
+
+def test_token_headers_resync_the_token_bucket():
+    scheduler = RateLimitScheduler(requests_per_minute=30, tokens_per_minute=18000)
+    scheduler.update(dict(GROQ_HEADERS, **{"x-ratelimit-remaining-tokens": "100"}))
+
+    with pytest.raises(RateLimitExceeded) as exc:
+        scheduler.acquire(1000, max_wait=0)
+
+    # The bucket refills the 17900 missing tokens within the 7.66s reset window.
+    assert exc.value.wait_seconds == pytest.approx(900 / (17900 / 7.66), rel=0.05)
+    assert scheduler.stats()["requests_available"] == pytest.approx(30, abs=0.1)